@@ -177,7 +177,7 @@ async def receive_agent_heartbeat(
     
     Security enforced:
     1. Bearer token validation (SHA256 hash check)
-    2. Rate limiting (50 heartbeats/min per token)
+    2. Rate limiting (6 heartbeats/min per token)
     3. Nonce replay detection
     4. Timestamp freshness (< 60 sec old)
     5. Device approval status
@@ -318,11 +318,10 @@ async def receive_agent_heartbeat(
         device.last_seen_at = now
         
         # ===== SECURITY CHECK 9: Store Telemetry =====
-        metrics_json = json.dumps(heartbeat.metrics.dict(exclude_none=True), default=str)
         telemetry = Telemetry(
             device_id=device.id,
             collected_at=hb_timestamp,
-            metrics=metrics_json,
+            metrics=heartbeat.metrics.model_dump(exclude_none=True),
             sample_count=1
         )
         db.add(telemetry)
@@ -730,7 +729,7 @@ async def get_device_telemetry(
                 {
                     "id": t.id,
                     "collected_at": t.collected_at,
-                    "metrics": json.loads(t.metrics) if t.metrics else None,
+                    "metrics": t.metrics,
                     "sample_count": t.sample_count
                 }
                 for t in telemetry_snapshots
@@ -1,24 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, UploadFile, File, Body, Header
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, UploadFile, File, Body, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, FileResponse, Response
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, text, select, update, or_, and_, case
 import uuid
+import base64
 import secrets
+import time
+import asyncio
+import anyio.to_thread
 from fastapi.openapi.utils import get_openapi
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from jose import jwt, JWTError
-from datetime import datetime, timezone
+from datetime import datetime
 import logging
 from dotenv import load_dotenv, find_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, TypeAdapter
 from typing import Optional, Any
 import os
 import json
+import orjson
 from pathlib import Path
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter
 import shutil
-from PIL import Image, ImageDraw, ImageFont
-import io
+import stat
+from xml.sax.saxutils import escape
 
 # Load environment variables
 env_path = Path(__file__).parent / ".env"
@@ -27,11 +37,17 @@ found_env = find_dotenv(".env", usecwd=True)
 if found_env:
     env_candidates.append(Path(found_env))
 
+# When started from backend/, find_dotenv returns env_path itself:
+# parse each distinct file once, in order (later files still override)
 _loaded_env_paths: list[str] = []
+_seen_env_files: set[Path] = set()
 for candidate in env_candidates:
-    if candidate and Path(candidate).exists():
-        load_dotenv(dotenv_path=candidate, override=True)
-        _loaded_env_paths.append(str(candidate))
+    resolved = candidate.resolve()
+    if resolved in _seen_env_files or not resolved.is_file():
+        continue
+    _seen_env_files.add(resolved)
+    load_dotenv(dotenv_path=resolved, override=True)
+    _loaded_env_paths.append(str(candidate))
 
 logger = logging.getLogger("backend")
 
@@ -44,21 +60,31 @@ def _require_env_var(name: str) -> str:
 
 
 # Fail fast if Microsoft OAuth is not configured
-_require_env_var("MICROSOFT_CLIENT_ID")
-_require_env_var("MICROSOFT_TENANT_ID")
+MICROSOFT_CLIENT_ID = _require_env_var("MICROSOFT_CLIENT_ID")
+MICROSOFT_TENANT_ID = _require_env_var("MICROSOFT_TENANT_ID")
 
 
 # Create avatars directory if it doesn't exist
 AVATARS_DIR = Path(__file__).parent / "avatars"
 AVATARS_DIR.mkdir(exist_ok=True)
 
+# Largest profile photo accepted, checked before the image is decoded
+MAX_PHOTO_SIZE_BYTES = 10 * 1024 * 1024
+
+# Default avatars are written as SVG; set AVATAR_FORMAT=png for Pillow-rendered PNGs
+AVATAR_FORMAT = os.getenv("AVATAR_FORMAT", "svg").lower()
+
+# Resampling filter for shrinking uploaded photos (a Pillow Image.Resampling
+# name: bilinear, bicubic, lanczos, ...)
+PHOTO_RESAMPLE = os.getenv("PHOTO_RESAMPLE", "bilinear").upper()
+
 # Internal imports
-from database import Base, engine, SessionLocal
+from database import SessionLocal, DB_POOL_SIZE, DB_MAX_OVERFLOW
 import models
 from schemas import (
     UserCreate, UserLogin, LogCreate, LogResponse, TokenResponse, UserResponse,
     EnhancedTokenResponse, SessionResponse, EnhancedLogResponse,
-    AdminUsersResponse, AdminUserLogsResponse, AdminSessionsResponse, AdminUserOut,
+    AdminUsersResponse, AdminUserLogsResponse, AdminSessionsResponse,
     LockUnlockRequestCreate, LockUnlockRequestResponse, ReviewRequestAction, PendingRequestsResponse,
     DeviceRegister, DeviceResponse,
     AgentRegisterRequest, AgentRegisterResponse, AgentHeartbeatRequest, AgentHeartbeatResponse,
@@ -66,32 +92,37 @@ from schemas import (
     AgentApprovalRequest, AgentApprovalResponse, LoginHistoryResponse
 )
 from utils import (
-    get_client_ip, get_user_agent_info, get_location_from_ip,
+    get_client_ip, get_user_agent_info, parse_user_agent, get_location_from_ip,
     get_location_string, calculate_login_risk_score, get_risk_status,
     update_login_ip_history, hash_agent_token, verify_agent_token,
     calculate_agent_trust_score, generate_agent_token, validate_agent_token_rotation,
     revoke_device_sessions, create_login_session, resolve_location_data
 )
 from rate_limit import check_rate_limit_ip, check_rate_limit_token
-from auth import hash_password, verify_password, create_access_token, create_refresh_token, SECRET_KEY, ALGORITHM
-from dependencies import get_current_user, admin_required
+from log_queue import log_buffer, telemetry_buffer
+from schema_setup import ensure_db_schema
+from auth import (
+    hash_password, verify_password_cached, create_access_token, create_refresh_token,
+    JWT_KEY, ALGORITHM, DUMMY_PASSWORD_HASH
+)
+from dependencies import get_db, get_current_user, admin_required, get_agent_token
 from models import Log, User, Device, Telemetry
 from google_oauth import verify_google_token, get_or_create_google_user
 from microsoft_oauth import verify_microsoft_token, get_or_create_microsoft_user
 from time_utils import now_ist, ensure_ist
 
+# Built once and reused to serialize whole pages of rows
+_LOCK_REQUESTS_ADAPTER = TypeAdapter(list[LockUnlockRequestResponse])
+
 
 # Custom JSON encoder to handle timezone-aware datetimes
 class CustomJSONResponse(JSONResponse):
+    # Datetimes are passed through to json_encoder so they keep the IST offset;
+    # int dict keys are stringified like the stdlib encoder does
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
     def render(self, content) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            default=self.json_encoder
-        ).encode("utf-8")
+        return orjson.dumps(content, default=self.json_encoder, option=self.ORJSON_OPTIONS)
     
     @staticmethod
     def json_encoder(obj):
@@ -112,25 +143,48 @@ app = FastAPI(
 
 @app.on_event("startup")
 def _startup_env_check() -> None:
-    client_id = os.getenv("MICROSOFT_CLIENT_ID")
-    tenant_id = os.getenv("MICROSOFT_TENANT_ID")
+    # Presence was enforced at import by _require_env_var; just report it
     logger.info(
         "Startup env check microsoft_client_id=%s microsoft_tenant_id=%s env_paths=%s",
-        bool(client_id),
-        tenant_id,
+        bool(MICROSOFT_CLIENT_ID),
+        MICROSOFT_TENANT_ID,
         _loaded_env_paths or "(no .env found)",
     )
-    if not client_id or not tenant_id:
-        raise RuntimeError(
-            "Missing MICROSOFT_CLIENT_ID or MICROSOFT_TENANT_ID. "
-            f"Checked: {_loaded_env_paths or '(no .env found)'}"
-        )
+
+
+# Sync endpoints (and their DB work) run on anyio's worker threadpool. Nearly
+# every one holds a pooled connection for its whole run, so threads beyond
+# the pool's capacity would only block in pool checkout (and fail after
+# pool_timeout); size the two together. Raise DB_POOL_SIZE/DB_MAX_OVERFLOW
+# to get more threads, or set THREADPOOL_SIZE explicitly when some threads
+# serve DB-free work.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+
+
+@app.on_event("startup")
+async def _configure_threadpool() -> None:
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+@app.on_event("startup")
+async def _start_write_buffers() -> None:
+    log_buffer.start()
+    telemetry_buffer.start()
+
+
+@app.on_event("shutdown")
+async def _stop_write_buffers() -> None:
+    await log_buffer.stop()
+    await telemetry_buffer.stop()
 
 
 def is_superadmin(user) -> bool:
     return user and user.role == "superadmin"
 
 
+# Date filters repeat across the pages of one listing; datetimes are immutable,
+# so parsed values can be shared
+@lru_cache(maxsize=4096)
 def parse_iso_datetime(value: str | None):
     if not value:
         return None
@@ -150,114 +204,311 @@ def build_pagination(total: int, page: int, limit: int):
         "total_pages": total_pages
     }
 
+def fetch_page(query, offset: int, limit: int):
+    """
+    Fetch one page of an ordered query together with the total row count.
+
+    The total rides along as a COUNT(*) OVER () column, so the page and the
+    count come back from a single statement. Rows are returned in the same
+    shape query.all() would give.
+    """
+    single_entity = len(query.column_descriptions) == 1
+    rows = query.add_columns(func.count().over()).offset(offset).limit(limit).all()
+    if not rows:
+        # Past the last page there is no row to carry the count
+        return [], (query.order_by(None).count() if offset else 0)
+    total = rows[0][-1]
+    if single_entity:
+        return [row[0] for row in rows], total
+    return [tuple(row[:-1]) for row in rows], total
+
+
+def seek_before(query, ts_column, id_column, before_ts: datetime, before_id: int):
+    """Restrict a (ts DESC, id DESC) ordered query to rows after the given one"""
+    before_ts = ensure_ist(before_ts)
+    return query.filter(or_(
+        ts_column < before_ts,
+        and_(ts_column == before_ts, id_column < before_id)
+    ))
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for the row (ts, row_id)"""
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises 400 for anything it didn't produce"""
+    try:
+        ts_value, id_value = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts_value), int(id_value)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def next_page_cursor(rows: list, limit: int, ts_attr: str):
+    """Cursor for the page after `rows`, or None when this was the last page"""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, ts_attr), last.id)
+
+
+def fetch_logs_page(query, skip: int, limit: int, cursor: Optional[str], response: Response):
+    """
+    One newest-first page of a Log query.
+
+    With a `cursor` (the next_cursor of the previous page) the page seeks past
+    it on the time index instead of scanning and discarding `skip` rows; skip
+    is then ignored. These endpoints return a bare list, so the cursor for the
+    following page travels in the X-Next-Cursor header.
+    """
+    query = query.order_by(Log.time.desc(), Log.id.desc())
+    if cursor:
+        query = seek_before(query, Log.time, Log.id, *decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    logs = query.limit(limit).all()
+    next_cursor = next_page_cursor(logs, limit, "time")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return logs
+
+
+def user_search_filter(search_value: str):
+    """
+    Substring match on username, name and both emails.
+
+    SQLite's LIKE is already case-insensitive for ASCII, which is all lower()
+    folds without ICU. Plain LIKE therefore matches exactly what ilike() would,
+    without wrapping every column and the pattern in lower() for each row.
+    """
+    like = f"%{search_value}%"
+    return or_(
+        models.User.username.like(like),
+        models.User.name.like(like),
+        models.User.company_email.like(like),
+        models.User.personal_email.like(like)
+    )
+
+
+def count_active_sessions(db: Session, user_ids: list) -> dict:
+    """
+    Active session count per user for one page of users.
+
+    Only the page's users are counted (via the sessions (user_id, is_active)
+    index) instead of aggregating the whole sessions table. Users without
+    active sessions are absent from the result.
+    """
+    if not user_ids:
+        return {}
+    return dict(
+        db.query(models.Session.user_id, func.count(models.Session.id))
+        .filter(
+            models.Session.user_id.in_(user_ids),
+            models.Session.is_active == True
+        )
+        .group_by(models.Session.user_id)
+        .all()
+    )
+
 # ---------------- CORS SETTINGS ----------------
-cors_origins = [origin.strip() for origin in os.getenv(
+# A frozenset: CORSMiddleware checks each request's Origin with `in`, which is
+# then a hash lookup instead of a list scan
+cors_origins = frozenset(origin.strip() for origin in os.getenv(
     "CORS_ORIGINS",
     "http://localhost:5174,http://localhost:5173,http://127.0.0.1:5173,http://127.0.0.1:5174"
-).split(",")]
+).split(",") if origin.strip())
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The log listings hand out their next-page cursor in this header
+    expose_headers=["X-Next-Cursor"],
+    # Let browsers reuse a preflight for 2h (Chromium's cap) instead of 10 min
+    max_age=7200,
 )
 
-# Create DB tables
-Base.metadata.create_all(bind=engine)
 
+# ---------------- RESPONSE COMPRESSION ----------------
+class APIGZipMiddleware(GZipMiddleware):
+    """GZip for API responses; avatars are already-compressed images and skip it"""
 
-def _ensure_sqlite_oauth_schema() -> None:
-    """Best-effort SQLite compatibility patch for existing dev databases."""
-    try:
-        with engine.begin() as conn:
-            result = conn.execute(text("PRAGMA table_info(users)"))
-            columns = {row[1] for row in result.fetchall()}
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith("/avatars/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
-            if "auth_provider" not in columns:
-                conn.execute(
-                    text("ALTER TABLE users ADD COLUMN auth_provider VARCHAR NOT NULL DEFAULT 'local'")
-                )
-                logger.warning("Added missing users.auth_provider column")
 
-            if "microsoft_id" not in columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN microsoft_id VARCHAR"))
-                logger.warning("Added missing users.microsoft_id column")
+# JSON lists and CSV exports shrink several-fold; bodies under 1 KB aren't
+# worth the CPU. Only applied when the client sends Accept-Encoding: gzip.
+app.add_middleware(APIGZipMiddleware, minimum_size=1024, compresslevel=5)
 
-            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_auth_provider ON users (auth_provider)"))
-            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_microsoft_id ON users (microsoft_id)"))
-    except Exception as exc:
-        logger.warning("SQLite schema compatibility check skipped: %s", str(exc))
+# Schema setup belongs to deploy time (`python manage.py migrate`). With
+# RUN_MIGRATIONS_ON_BOOT=1 (the default, so a plain `uvicorn app:app` works on a
+# fresh checkout) it is also checked on import, which costs one PRAGMA read
+# once the database is current; deployments that migrate up front set it to 0.
+if os.getenv("RUN_MIGRATIONS_ON_BOOT", "1") == "1":
+    ensure_db_schema()
 
+# Behind nginx, set X_ACCEL_ENABLED=1 and map X_ACCEL_AVATARS_PREFIX to an
+# `internal` location aliasing the avatars directory; nginx then sends the file
+# and the worker only answers with a header.
+X_ACCEL_ENABLED = os.getenv("X_ACCEL_ENABLED", "").lower() in ("1", "true", "yes")
+X_ACCEL_AVATARS_PREFIX = os.getenv("X_ACCEL_AVATARS_PREFIX", "/internal-avatars/")
 
-_ensure_sqlite_oauth_schema()
+# Avatar and photo filenames end in a random uuid, so a name is never reused
+# for different content and browsers may keep them indefinitely
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-# Mount avatars directory for serving user photos
-app.mount("/avatars", StaticFiles(directory=str(AVATARS_DIR)), name="avatars")
 
-# DB Session
-def get_db():
-    db = SessionLocal()
+# Serve user photos and avatars
+@app.api_route("/avatars/{filename}", methods=["GET", "HEAD"], include_in_schema=False)
+def serve_avatar(filename: str):
+    # Only regular files directly inside the avatars directory
+    if Path(filename).name != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Not Found")
+    avatar_path = AVATARS_DIR / filename
     try:
-        yield db
-    finally:
-        db.close()
+        stat_result = os.stat(avatar_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    headers = {"Cache-Control": AVATAR_CACHE_CONTROL}
+    if X_ACCEL_ENABLED:
+        headers["X-Accel-Redirect"] = f"{X_ACCEL_AVATARS_PREFIX}{filename}"
+        return Response(headers=headers)
+    # The stat result is handed over so FileResponse doesn't stat the file again
+    return FileResponse(avatar_path, stat_result=stat_result, headers=headers)
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+# Initials depend only on the name, so repeat names are served from the cache
+@lru_cache(maxsize=1024)
+def _compute_initials(name: str) -> str:
+    """First letters of the first two words of a name, "U" if there are none"""
+    letters = []
+    prev_space = True
+    for ch in name:
+        if ch.isspace():
+            prev_space = True
+            continue
+        if prev_space:
+            letters.append(ch.upper())
+            prev_space = False
+            if len(letters) == 2:
+                break
+    return "".join(letters) or "U"
+
+@lru_cache(maxsize=1)
+def _avatar_font():
+    """Font used for avatar initials, loaded once"""
+    from PIL import ImageFont
+
+    try:
+        # Try to use a nice font if available
+        return ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf" if os.name != 'nt' 
+                                  else "C:\\Windows\\Fonts\\ariblk.ttf", 80)
+    except:
+        return ImageFont.load_default()
+
+# With a fixed font the rendered size depends only on the initials, so each
+# distinct pair is laid out by FreeType once
+@lru_cache(maxsize=1024)
+def _initials_size(initials: str) -> tuple:
+    """(width, height) of the initials drawn in the avatar font"""
+    bbox = _avatar_font().getbbox(initials)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+# SVG avatars are text, so the same initials and colour always give the same bytes
+@lru_cache(maxsize=2048)
+def render_initials_svg(initials: str, color: str) -> bytes:
+    """200x200 avatar: white initials centred on a coloured square"""
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="200" height="200" viewBox="0 0 200 200">'
+        f'<rect width="200" height="200" fill="{color}"/>'
+        '<text x="100" y="100" fill="white" font-family="DejaVu Sans, Arial Black, Arial, sans-serif" '
+        'font-size="80" font-weight="bold" text-anchor="middle" dominant-baseline="central">'
+        f'{escape(initials)}</text></svg>'
+    ).encode("utf-8")
+
+def _render_initials_png(initials: str, color: str, avatar_path: Path) -> None:
+    """Rasterize the avatar with Pillow (AVATAR_FORMAT=png)"""
+    # Pillow is only needed for PNG avatars and photo uploads; import it on
+    # first use so workers that never touch images don't load it
+    from PIL import Image, ImageDraw
+
+    size = 200
+    img = Image.new("RGB", (size, size), color=color)
+    draw = ImageDraw.Draw(img)
+    
+    # Draw initials
+    font = _avatar_font()
+    
+    # Center text
+    text_width, text_height = _initials_size(initials)
+    x = (size - text_width) // 2
+    y = (size - text_height) // 2
+    
+    draw.text((x, y), initials, fill="white", font=font)
+    img.save(avatar_path)
+
+# Color palette for avatars
+_AVATAR_COLORS = (
+    "#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8",
+    "#F7DC6F", "#BB8FCE", "#85C1E2", "#F8B88B", "#90EE90"
+)
+
 # Helper function to generate default avatar with initials
 def generate_default_avatar(name: str, user_id: int) -> str:
     """Generate a colorful avatar with user initials"""
     try:
-        # Get initials from name
-        initials = "".join([word[0].upper() for word in name.split() if word])[:2]
-        if not initials:
-            initials = "U"
-        
-        # Color palette for avatars
-        colors = [
-            "#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8",
-            "#F7DC6F", "#BB8FCE", "#85C1E2", "#F8B88B", "#90EE90"
-        ]
-        color = colors[user_id % len(colors)]
-        
-        # Create image
-        size = 200
-        img = Image.new("RGB", (size, size), color=color)
-        draw = ImageDraw.Draw(img)
-        
-        # Draw initials
-        try:
-            # Try to use a nice font if available
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf" if os.name != 'nt' 
-                                     else "C:\\Windows\\Fonts\\ariblk.ttf", 80)
-        except:
-            font = ImageFont.load_default()
-        
-        # Center text
-        bbox = draw.textbbox((0, 0), initials, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        x = (size - text_width) // 2
-        y = (size - text_height) // 2
-        
-        draw.text((x, y), initials, fill="white", font=font)
+        initials = _compute_initials(name)
+        color = _AVATAR_COLORS[user_id % len(_AVATAR_COLORS)]
         
         # Save avatar
-        avatar_filename = f"avatar_{user_id}_{int(now_ist().timestamp())}.png"
+        ext = "png" if AVATAR_FORMAT == "png" else "svg"
+        avatar_filename = f"avatar_{user_id}_{uuid.uuid4().hex}.{ext}"
         avatar_path = AVATARS_DIR / avatar_filename
-        img.save(avatar_path)
+        if ext == "png":
+            _render_initials_png(initials, color, avatar_path)
+        else:
+            avatar_path.write_bytes(render_initials_svg(initials, color))
         
         return f"/avatars/{avatar_filename}"
     except Exception as e:
         print(f"Avatar generation error: {str(e)}")
         return None
 
+def _store_photo(fileobj, filepath: Path) -> None:
+    """Decode an uploaded image, shrink it to fit 500x500 and save it"""
+    from PIL import Image
+
+    # Starlette has already spooled the upload to a temporary file; let PIL
+    # read from it directly instead of copying the whole body into memory
+    fileobj.seek(0)
+    img = Image.open(fileobj)
+    # Resize if too large. thumbnail() first has JPEG decode at a reduced
+    # scale (draft) and box-reduces to within 2x of the target, so the filter
+    # only runs on the last step
+    if img.size[0] > 500 or img.size[1] > 500:
+        resample = getattr(Image.Resampling, PHOTO_RESAMPLE, Image.Resampling.BILINEAR)
+        img.thumbnail((500, 500), resample)
+    img.save(filepath)
+
 # Helper function to save uploaded photo
 async def save_user_photo(file: UploadFile, user_id: int) -> str:
     """Save uploaded photo and return the path"""
+    if file.size and file.size > MAX_PHOTO_SIZE_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
     try:
         # Create unique filename
         file_ext = file.filename.split(".")[-1] if file.filename else "jpg"
@@ -265,17 +516,13 @@ async def save_user_photo(file: UploadFile, user_id: int) -> str:
         if file_ext not in ["jpg", "jpeg", "png", "gif"]:
             file_ext = "jpg"
         
-        filename = f"photo_{user_id}_{int(now_ist().timestamp())}.{file_ext}"
+        filename = f"photo_{user_id}_{uuid.uuid4().hex}.{file_ext}"
         filepath = AVATARS_DIR / filename
         
-        # Read and validate image
-        contents = await file.read()
+        # Decoding, resizing and encoding are CPU work plus a disk write;
+        # keep them off the event loop
         try:
-            img = Image.open(io.BytesIO(contents))
-            # Resize if too large
-            if img.size[0] > 500 or img.size[1] > 500:
-                img.thumbnail((500, 500), Image.Resampling.LANCZOS)
-            img.save(filepath)
+            await run_in_threadpool(_store_photo, file.file, filepath)
         except:
             raise HTTPException(status_code=400, detail="Invalid image file")
         
@@ -284,13 +531,33 @@ async def save_user_photo(file: UploadFile, user_id: int) -> str:
         print(f"Photo save error: {str(e)}")
         return None
 
-# Helper function to get user_id from username
-def get_user_id_by_username(username: str, db: Session) -> int:
-    """Resolve username to user_id"""
-    user = db.query(models.User).filter(models.User.username == username).first()
+# Short-lived username -> (user_id, role) cache so repeated log submissions
+# for the same user skip the lookup. Role changes and lock/unlock drop the
+# entry, but only in this process: with several workers the others can keep
+# a stale role for up to the TTL.
+_USER_LOOKUP_CACHE: dict[str, dict] = {}
+_USER_LOOKUP_TTL_SECONDS = 60
+_USER_LOOKUP_CACHE_MAX_ENTRIES = 10_000
+
+# Helper function to get user_id and role from username
+def get_user_id_by_username(username: str) -> tuple[int, str]:
+    """Resolve username to (user_id, role)"""
+    now = time.time()
+    cached = _USER_LOOKUP_CACHE.get(username)
+    if cached and cached["expires_at"] > now:
+        return cached["data"]
+
+    # Short-lived session of its own: only a cache miss needs the DB
+    with SessionLocal() as db:
+        user = db.query(models.User.id, models.User.role).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user.id
+    data = (user.id, user.role)
+    if len(_USER_LOOKUP_CACHE) >= _USER_LOOKUP_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order; drop the oldest entry
+        _USER_LOOKUP_CACHE.pop(next(iter(_USER_LOOKUP_CACHE)), None)
+    _USER_LOOKUP_CACHE[username] = {"data": data, "expires_at": now + _USER_LOOKUP_TTL_SECONDS}
+    return data
 
 # Helper class for registration with file support
 class RegisterRequest(BaseModel):
@@ -335,50 +602,113 @@ def format_browser_location(browser_location: Optional[dict[str, Any]]) -> Optio
 
     return None
 
+def registration_conflict(db: Session, username: str, company_email: str, personal_email: str) -> Optional[str]:
+    """
+    Error message for the first identifier already taken by another user, or None.
+
+    One OR query fetches every user holding any of the three identifiers (at
+    most three rows); the checks below keep the username -> company email ->
+    personal email precedence of the messages.
+    """
+    taken = db.query(
+        models.User.username, models.User.company_email, models.User.personal_email
+    ).filter(or_(
+        models.User.username == username,
+        models.User.company_email == company_email,
+        models.User.personal_email == personal_email
+    )).all()
+
+    if any(row.username == username for row in taken):
+        return "Username already exists"
+    if any(row.company_email == company_email for row in taken):
+        return "Company email already exists"
+    if any(row.personal_email == personal_email for row in taken):
+        return "Personal email already exists"
+    return None
+
+async def create_registered_user(user_data: RegisterRequest, db: Session, photo: Optional[UploadFile] = None):
+    """
+    Shared body of /register and /register/json: uniqueness check, user row,
+    then the uploaded photo or a generated avatar, committed together.
+    """
+    conflict = registration_conflict(db, user_data.username, user_data.company_email, user_data.personal_email)
+    if conflict:
+        raise HTTPException(status_code=400, detail=conflict)
+
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_pw = await run_in_threadpool(hash_password, user_data.password)
+
+    new_user = models.User(
+        username=user_data.username,
+        name=user_data.name,
+        company_email=user_data.company_email,
+        personal_email=user_data.personal_email,
+        password_hash=hashed_pw,
+        role="user"  # Force to user role regardless of input
+    )
+
+    db.add(new_user)
+    db.flush()  # Assigns new_user.id without committing
+
+    # Handle photo upload or generate default avatar
+    photo_path = None
+    if photo:
+        photo_path = await save_user_photo(photo, new_user.id)
+
+    # If no photo provided, generate default avatar with initials (file
+    # write, off the event loop)
+    if not photo_path:
+        photo_path = await run_in_threadpool(generate_default_avatar, user_data.name, new_user.id)
+
+    # Update user with photo path
+    if photo_path:
+        new_user.profile_photo = photo_path
+
+    # Read the response fields before commit expires the instance, so it
+    # isn't reloaded (every column is known after the flush). created_at is
+    # returned naive, as SQLite stores it and /profile reads it back.
+    user_data = {field: getattr(new_user, field) for field in UserResponse.model_fields}
+    user_data["created_at"] = user_data["created_at"].replace(tzinfo=None)
+    db.commit()
+
+    return user_data
+
+
+async def register_form_or_json(request: Request) -> RegisterRequest:
+    """
+    /register body as a RegisterRequest, from either JSON or form data.
+
+    Missing or empty fields are a 400 "Missing required fields"; any other
+    validation error (bad JSON, wrong types) is the usual 422 with pydantic's
+    error list.
+    """
+    try:
+        if 'application/json' in request.headers.get('content-type', ''):
+            # JSON payload: decoded and validated in one pass by pydantic
+            user_data = RegisterRequest.model_validate_json(await request.body())
+        else:
+            # Form data payload: already parsed (and cached) by FastAPI
+            # when it extracted the route's `photo` field
+            user_data = RegisterRequest.model_validate(dict(await request.form()))
+    except ValidationError as e:
+        errors = e.errors(include_url=False)
+        if all(error["type"] == "missing" for error in errors):
+            raise HTTPException(status_code=400, detail="Missing required fields")
+        # Same shape as FastAPI's own body validation errors
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in errors])
+
+    if not all([user_data.username, user_data.name, user_data.company_email,
+                user_data.personal_email, user_data.password]):
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    return user_data
+
+
 # Alternative endpoint for backward compatibility - accepts JSON
 @app.post("/register/json", response_model=UserResponse)
 async def register_json(user_data: RegisterRequest, db: Session = Depends(get_db)):
     """Register a new user with JSON payload (backward compat, no files)"""
     try:
-        username = user_data.username
-        name = user_data.name
-        company_email = user_data.company_email
-        personal_email = user_data.personal_email
-        password = user_data.password
-        
-        if db.query(models.User).filter(models.User.username == username).first():
-            raise HTTPException(status_code=400, detail="Username already exists")
-
-        if db.query(models.User).filter(models.User.company_email == company_email).first():
-            raise HTTPException(status_code=400, detail="Company email already exists")
-
-        if db.query(models.User).filter(models.User.personal_email == personal_email).first():
-            raise HTTPException(status_code=400, detail="Personal email already exists")
-
-        hashed_pw = hash_password(password)
-
-        new_user = models.User(
-            username=username,
-            name=name,
-            company_email=company_email,
-            personal_email=personal_email,
-            password_hash=hashed_pw,
-            role="user"
-        )
-
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-
-        # Generate default avatar
-        photo_path = generate_default_avatar(name, new_user.id)
-        if photo_path:
-            new_user.profile_photo = photo_path
-            db.commit()
-            db.refresh(new_user)
-
-        return new_user
-
+        return await create_registered_user(user_data, db)
     except HTTPException:
         raise
     except Exception as e:
@@ -388,78 +718,13 @@ async def register_json(user_data: RegisterRequest, db: Session = Depends(get_db
 # Main register endpoint - accepts form-data or JSON with optional file
 @app.post("/register", response_model=UserResponse)
 async def register(
-    request: Request,
+    user_data: RegisterRequest = Depends(register_form_or_json),
     photo: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db)
 ):
     """Register a new user with optional photo upload via form-data or JSON"""
     try:
-        # Parse request body
-        content_type = request.headers.get('content-type', '')
-        
-        if 'application/json' in content_type:
-            # JSON payload
-            body = await request.json()
-            username = body.get('username')
-            name = body.get('name')
-            company_email = body.get('company_email')
-            personal_email = body.get('personal_email')
-            password = body.get('password')
-        else:
-            # Form data payload
-            form = await request.form()
-            username = form.get('username')
-            name = form.get('name')
-            company_email = form.get('company_email')
-            personal_email = form.get('personal_email')
-            password = form.get('password')
-            # photo is already extracted
-        
-        # Validate required fields
-        if not all([username, name, company_email, personal_email, password]):
-            raise HTTPException(status_code=400, detail="Missing required fields")
-        
-        if db.query(models.User).filter(models.User.username == username).first():
-            raise HTTPException(status_code=400, detail="Username already exists")
-
-        if db.query(models.User).filter(models.User.company_email == company_email).first():
-            raise HTTPException(status_code=400, detail="Company email already exists")
-
-        if db.query(models.User).filter(models.User.personal_email == personal_email).first():
-            raise HTTPException(status_code=400, detail="Personal email already exists")
-
-        hashed_pw = hash_password(password)
-
-        new_user = models.User(
-            username=username,
-            name=name,
-            company_email=company_email,
-            personal_email=personal_email,
-            password_hash=hashed_pw,
-            role="user"  # Force to user role regardless of input
-        )
-
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-
-        # Handle photo upload or generate default avatar
-        photo_path = None
-        if photo:
-            photo_path = await save_user_photo(photo, new_user.id)
-        
-        # If no photo provided, generate default avatar with initials
-        if not photo_path:
-            photo_path = generate_default_avatar(name, new_user.id)
-        
-        # Update user with photo path
-        if photo_path:
-            new_user.profile_photo = photo_path
-            db.commit()
-            db.refresh(new_user)
-
-        return new_user
-
+        return await create_registered_user(user_data, db, photo)
     except HTTPException:
         raise
     except Exception as e:
@@ -473,7 +738,7 @@ def home():
 
 # LOGIN endpoint follows...# ---------------- LOGIN ----------------
 @app.post("/login", response_model=EnhancedTokenResponse)
-async def login(credentials: UserLogin, request: Request, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """
     PHASE 1: Enhanced login with full session tracking
     
@@ -488,6 +753,9 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
     - Comprehensive logging
     """
     try:
+        # Single timestamp shared by every row written during this login
+        now = now_ist()
+
         # Find user by company email, personal email, or username
         user = db.query(models.User).filter(
             (models.User.company_email == credentials.username) |
@@ -498,10 +766,19 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
         # Extract request metadata
         ip_address = get_client_ip(request)
         user_agent_info = get_user_agent_info(request)
-        location_data, _, _ = await resolve_location_data(
-            ip_address=ip_address,
-            request=request,
-            browser_location=credentials.browser_location
+
+        # Geolocation (network I/O) and bcrypt verification (CPU) are independent:
+        # run the hash check in the threadpool while the lookup is in flight.
+        # Unknown users are checked against a dummy hash to keep timing uniform.
+        password_hash = user.password_hash if user and user.password_hash else DUMMY_PASSWORD_HASH
+        loop = asyncio.get_running_loop()
+        (location_data, _, _), password_valid = await asyncio.gather(
+            resolve_location_data(
+                ip_address=ip_address,
+                request=request,
+                browser_location=credentials.browser_location
+            ),
+            loop.run_in_executor(None, verify_password_cached, credentials.password, password_hash)
         )
         location_string = get_location_string(location_data)
         browser_location_info = format_browser_location(credentials.browser_location)
@@ -511,7 +788,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
         # =====================================================================
         # FAILED LOGIN HANDLING
         # =====================================================================
-        if not user or not user.password_hash or not verify_password(credentials.password, user.password_hash):
+        if not user or not user.password_hash or not password_valid:
             failed_attempts_count = (user.failed_login_attempts + 1) if user else 0
             multiple_failed = failed_attempts_count >= 3
             risk_score = calculate_login_risk_score(
@@ -525,6 +802,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
             # Log failed login attempt
             failed_log = models.Log(
                 user_id=user.id if user else None,
+                user_role=user.role if user else None,
                 event_type="LOGIN_FAILED",
                 action="Failed Login Attempt",
                 details=f"Invalid credentials for {credentials.username}",
@@ -537,7 +815,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                 status=risk_status,
                 # Legacy fields
                 ip=ip_address,
-                time=now_ist()
+                time=now
             )
             db.add(failed_log)
 
@@ -548,12 +826,13 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                 # Lock account after 5 failed attempts
                 if user.failed_login_attempts >= 5:
                     user.account_locked = True
-                    user.locked_at = now_ist()
+                    user.locked_at = now
                     user.status = "locked"
 
                     # Log account lock
                     lock_log = models.Log(
                         user_id=user.id,
+                        user_role=user.role,
                         event_type="ACCOUNT_LOCKED",
                         action="Account Locked",
                         details=f"Account locked after {user.failed_login_attempts} failed login attempts",
@@ -565,13 +844,12 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                         risk_score=7,
                         status="suspicious",
                         ip=ip_address,
-                        time=now_ist()
+                        time=now
                     )
                     db.add(lock_log)
 
-                db.commit()
-            else:
-                db.commit()
+            # One commit for the failed-attempt log, the counter and any lock
+            db.commit()
 
             raise HTTPException(
                 status_code=401,
@@ -603,7 +881,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
             
             if device:
                 # Update last seen for existing agent device
-                device.last_seen_at = now_ist()
+                device.last_seen_at = now
                 device_id_for_session = device.id
                 
                 # Check if device is inactive
@@ -611,6 +889,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                     # Log device blocked event
                     device_blocked_log = models.Log(
                         user_id=user.id,
+                        user_role=user.role,
                         event_type="DEVICE_BLOCKED",
                         action="Login Denied - Inactive Device",
                         details=f"Login attempt with inactive device: {device.device_name} (UUID: {device.device_uuid})",
@@ -622,7 +901,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                         risk_score=8,
                         status="blocked",
                         ip=ip_address,
-                        time=now_ist()
+                        time=now
                     )
                     db.add(device_blocked_log)
                     db.commit()
@@ -637,6 +916,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                         # Log device untrusted event
                         device_untrusted_log = models.Log(
                             user_id=user.id,
+                            user_role=user.role,
                             event_type="DEVICE_UNTRUSTED",
                             action="Login Denied - Low Device Trust",
                             details=f"Login attempt with untrusted device: {device.device_name} (Trust Score: {device.trust_score})",
@@ -648,7 +928,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
                             risk_score=7,
                             status="untrusted",
                             ip=ip_address,
-                            time=now_ist()
+                            time=now
                         )
                         db.add(device_untrusted_log)
                         db.commit()
@@ -661,23 +941,30 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
         # SUCCESSFUL LOGIN - CREATE SESSION WITH RISK ASSESSMENT
         # =====================================================================
         
-        # Use new comprehensive session creation helper
+        # create_login_session only flushes, so user, device and the new
+        # session stay loaded until the single commit below
+        user_id, user_role, username = user.id, user.role, user.username
+        device_info = f" with agent device: {device.device_name} (UUID: {device.device_uuid})" if device else ""
+
+        # Use new comprehensive session creation helper (the commit below
+        # also persists device.last_seen_at set above)
         session = await create_login_session(
             db=db,
-            user_id=user.id,
+            user_id=user_id,
             request=request,
             device_id=device_id_for_session,
+            background_tasks=background_tasks,
             browser_location=credentials.browser_location,
             risk_threshold=0.5  # Send email if risk >= 0.5
         )
 
         # Create success log
-        device_info = f" with agent device: {device.device_name} (UUID: {device.device_uuid})" if device else ""
         success_log = models.Log(
-            user_id=user.id,
+            user_id=user_id,
+            user_role=user_role,
             event_type="LOGIN_SUCCESS",
             action="Successful Login",
-            details=f"User {user.username} logged in successfully{device_info}",
+            details=f"User {username} logged in successfully{device_info}",
             ip_address=session.ip_address,
             location=f"{session.city}, {session.country}",
             device=session.device,
@@ -687,43 +974,44 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
             status=session.status,
             # Legacy fields
             ip=session.ip_address,
-            time=now_ist()
+            time=now
         )
         db.add(success_log)
 
         # Reset failed login attempts
         user.failed_login_attempts = 0
 
-        # Update device last_seen_at if agent device was used
-        if device:
-            device.last_seen_at = now_ist()
+        # Read everything the response needs before commit expires the
+        # instances, so no SELECT is issued to reload them afterwards
+        response_data = {
+            "token_type": "bearer",
+            "role": user_role,
+            "username": username,
+            "session_id": session.session_id,
+            "device": session.device,
+            "device_id": device_id_for_session,
+            "location": f"{session.city}, {session.country}"
+        }
 
         # Commit all changes
         db.commit()
-        db.refresh(session)
 
         # Generate tokens with optional device binding
         access_token = create_access_token({
-            "sub": str(user.id),  # user ID as string (JWT requirement)
+            "sub": str(user_id),  # user ID as string (JWT requirement)
             "device_id": device_id_for_session,  # bind session to agent device (can be None)
-            "session_id": session.session_id  # unique session identifier
+            "session_id": response_data["session_id"]  # unique session identifier
         })
         refresh_token = create_refresh_token({
-            "sub": str(user.id),
+            "sub": str(user_id),
             "device_id": device_id_for_session,
-            "session_id": session.session_id
+            "session_id": response_data["session_id"]
         })
 
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
-            "token_type": "bearer",
-            "role": user.role,
-            "username": user.username,
-            "session_id": session.session_id,
-            "device": session.device,
-            "device_id": device_id_for_session,
-            "location": f"{session.city}, {session.country}"
+            **response_data
         }
 
     except HTTPException:
@@ -734,7 +1022,7 @@ async def login(credentials: UserLogin, request: Request, db: Session = Depends(
 
 # ---------------- REFRESH TOKEN ----------------
 @app.post("/login/microsoft", response_model=EnhancedTokenResponse)
-async def login_microsoft(req: MicrosoftTokenRequest, request: Request, db: Session = Depends(get_db)):
+async def login_microsoft(req: MicrosoftTokenRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Microsoft OAuth sign-in endpoint"""
     try:
         token = (req.id_token or req.token or "").strip()
@@ -751,12 +1039,14 @@ async def login_microsoft(req: MicrosoftTokenRequest, request: Request, db: Sess
             user_id=user.id,
             request=request,
             device_id=None,
+            background_tasks=background_tasks,
             browser_location=req.browser_location,
             risk_threshold=0.5
         )
 
         oauth_log = models.Log(
             user_id=user.id,
+            user_role=user.role,
             event_type="LOGIN_SUCCESS",
             action="Successful Microsoft OAuth Login",
             details=f"User {user.username} logged in via Microsoft OAuth",
@@ -814,7 +1104,7 @@ async def login_microsoft(req: MicrosoftTokenRequest, request: Request, db: Sess
 def refresh_token(token: str = Query(...), db: Session = Depends(get_db)):
     """Refresh an expired access token with device-bound session validation"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, JWT_KEY, algorithms=[ALGORITHM])
         user_id_str = payload.get("sub")
         device_id = payload.get("device_id")
         session_id = payload.get("session_id")
@@ -897,7 +1187,7 @@ class GoogleTokenRequest(BaseModel):
 
 
 @app.post("/login/google", response_model=EnhancedTokenResponse)
-async def login_google(req: GoogleTokenRequest, request: Request, db: Session = Depends(get_db)):
+async def login_google(req: GoogleTokenRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Google OAuth sign-in endpoint."""
     try:
         if not req.token or not req.token.strip():
@@ -912,12 +1202,14 @@ async def login_google(req: GoogleTokenRequest, request: Request, db: Session =
             user_id=user.id,
             request=request,
             device_id=None,
+            background_tasks=background_tasks,
             browser_location=req.browser_location,
             risk_threshold=0.5
         )
 
         oauth_log = models.Log(
             user_id=user.id,
+            user_role=user.role,
             event_type="LOGIN_SUCCESS",
             action="Successful Google OAuth Login",
             details=f"User {user.username} logged in via Google OAuth",
@@ -972,8 +1264,17 @@ async def login_google(req: GoogleTokenRequest, request: Request, db: Session =
 # ============================================================================
 # LOGOUT ----------------
 # ============================================================================
+class LogoutRequest(BaseModel):
+    browser_location: Optional[dict[str, Any]] = None
+
+
 @app.post("/logout")
-async def logout(request: Request, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def logout(
+    request: Request,
+    req: Optional[LogoutRequest] = Body(None),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
     """
     PHASE 1: Enhanced logout with session tracking
     
@@ -983,32 +1284,56 @@ async def logout(request: Request, db: Session = Depends(get_db), current_user=D
     - Create logout log with full metadata
     """
     try:
-        # Extract request metadata
+        # Extract request metadata (including the geolocation lookup) before
+        # any writes, so the transaction below stays short. The user agent is
+        # parsed in the threadpool while the geolocation request is in flight.
         ip_address = get_client_ip(request)
-        user_agent_info = get_user_agent_info(request)
-        location_data = await get_location_from_ip(ip_address)
+        location_task = asyncio.create_task(get_location_from_ip(ip_address))
+        try:
+            user_agent_info = await run_in_threadpool(get_user_agent_info, request)
+            location_data = await location_task
+        finally:
+            # No-op once the lookup finished; otherwise UA parsing raised and
+            # the lookup must not be left running unawaited
+            location_task.cancel()
         location_string = get_location_string(location_data)
-        browser_location_info = format_browser_location(req.browser_location)
+        browser_location_info = format_browser_location(req.browser_location if req else None)
         if browser_location_info:
             location_string = f"{location_string} | {browser_location_info}"
 
-        # Find active session for this user
-        active_session = db.query(models.Session).filter(
-            models.Session.user_id == current_user.id,
-            models.Session.is_active == True
-        ).order_by(models.Session.login_at.desc()).first()
-
-        # Close session if found
-        if active_session:
-            active_session.logout_at = now_ist()
-            active_session.is_active = False
+        now = now_ist()
 
-        # Update user logout time
-        current_user.last_logout_at = now_ist()
+        # Close the user's most recent active session in a single UPDATE
+        latest_active_session = (
+            select(models.Session.id)
+            .where(
+                models.Session.user_id == current_user.id,
+                models.Session.is_active == True
+            )
+            .order_by(models.Session.login_at.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        session_closed = db.execute(
+            update(models.Session)
+            .where(models.Session.id == latest_active_session)
+            .values(is_active=False, logout_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount > 0
+
+        # Update user logout time (current_user belongs to the auth dependency's
+        # DB session, so write it through this one)
+        db.execute(
+            update(models.User)
+            .where(models.User.id == current_user.id)
+            .values(last_logout_at=now)
+            .execution_options(synchronize_session=False)
+        )
 
         # Create logout log
         logout_log = models.Log(
             user_id=current_user.id,
+            user_role=current_user.role,
             event_type="LOGOUT",
             action="User Logout",
             details=f"User {current_user.username} logged out",
@@ -1021,15 +1346,17 @@ async def logout(request: Request, db: Session = Depends(get_db), current_user=D
             status="normal",
             # Legacy fields
             ip=ip_address,
-            time=now_ist()
+            time=now
         )
         db.add(logout_log)
+        # current_user shares this session, so read it before commit expires it
+        message = f"User {current_user.username} logged out successfully"
         db.commit()
 
         return {
-            "message": f"User {current_user.username} logged out successfully",
-            "session_closed": active_session is not None,
-            "timestamp": now_ist().isoformat()
+            "message": message,
+            "session_closed": session_closed,
+            "timestamp": now.isoformat()
         }
     except Exception as e:
         db.rollback()
@@ -1057,10 +1384,11 @@ async def update_profile_photo(photo: UploadFile = File(...), db: Session = Depe
             raise HTTPException(status_code=404, detail="User not found")
         
         user.profile_photo = photo_path
+        # Serialize before commit expires the instance, so it isn't reloaded
+        user_data = UserResponse.model_validate(user)
         db.commit()
-        db.refresh(user)
         
-        return user
+        return user_data
     except HTTPException:
         raise
     except Exception as e:
@@ -1071,7 +1399,7 @@ async def update_profile_photo(photo: UploadFile = File(...), db: Session = Depe
 # Agent Download Endpoint (USER & ADMIN)
 # ============================================================================
 @app.get("/agent/download")
-def download_agent(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+async def download_agent(current_user=Depends(get_current_user)):
     """Download the Zero Trust Agent for Windows
     
     Returns the agent executable file for installation on user's device
@@ -1096,20 +1424,22 @@ def download_agent(current_user=Depends(get_current_user), db: Session = Depends
                     detail="Agent executable not available. Please contact administrator."
                 )
         
-        # Log the agent download
-        try:
-            log_entry = models.Log(
-                user_id=current_user.id,
-                action="AGENT_DOWNLOAD",
-                details=f"Agent executable downloaded by {current_user.username}",
-                ip=None,
-                device=None,
-                time=datetime.now(timezone.utc)
-            )
-            db.add(log_entry)
-            db.commit()
-        except:
-            pass  # Don't fail download if logging fails
+        # Log the agent download (queued; the batch writer logs its own failures)
+        now = now_ist()
+        await log_buffer.put({
+            "user_id": current_user.id,
+            "user_role": current_user.role,
+            "event_type": "AGENT_DOWNLOAD",
+            "action": "AGENT_DOWNLOAD",
+            "details": f"Agent executable downloaded by {current_user.username}",
+            "ip_address": "unknown",
+            "device": "unknown",
+            "risk_score": 0.0,
+            "status": "normal",
+            "timestamp": now,
+            # Legacy fields
+            "time": now
+        })
         
         return FileResponse(
             path=agent_file_path,
@@ -1156,9 +1486,15 @@ def get_agent_info(current_user=Depends(get_current_user)):
 
 
 # Admin Panel ----------------
+# Lets a polling dashboard reuse the browser's copy instead of re-running the
+# auth pipeline every few seconds. Private: the response is per-user.
+ADMIN_DASHBOARD_CACHE_SECONDS = 30
+
+
 @app.get("/admin/dashboard")
-def admin_dashboard(current_user=Depends(admin_required)):
+def admin_dashboard(response: Response, current_user=Depends(admin_required)):
     """Admin dashboard (admin access required)"""
+    response.headers["Cache-Control"] = f"private, max-age={ADMIN_DASHBOARD_CACHE_SECONDS}"
     return {"message": "Admin Access OK", "user": current_user.username}
 
 # ---------------- Update User Role (Admin Only) ----------------
@@ -1174,10 +1510,18 @@ def update_user_role(user_id: int, new_role: str, db: Session = Depends(get_db),
             raise HTTPException(status_code=404, detail="User not found")
         
         user.role = new_role
+        # Keep the denormalized role on the user's logs in step
+        db.query(models.Log).filter(models.Log.user_id == user_id).update(
+            {"user_role": new_role}, synchronize_session=False
+        )
+        # Serialize before commit expires the instance, so it isn't reloaded
+        user_data = UserResponse.model_validate(user)
         db.commit()
-        db.refresh(user)
+        # Dropped after the commit so a concurrent lookup can't re-cache the
+        # old role in between
+        _USER_LOOKUP_CACHE.pop(user_data.username, None)
 
-        return user
+        return user_data
     except HTTPException:
         raise
     except Exception as e:
@@ -1185,53 +1529,63 @@ def update_user_role(user_id: int, new_role: str, db: Session = Depends(get_db),
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # ---------------- Log Collector (AUTH REQUIRED) ----------------
-@app.post("/collect-log", response_model=dict)
-def collect_log(log_data: LogCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+@app.post("/collect-log", response_model=dict, status_code=202)
+async def collect_log(log_data: LogCreate, current_user=Depends(get_current_user)):
     """
     Collect activity logs from agents (AUTHENTICATION REQUIRED)
     
     Note: This endpoint uses the username field from the agent to resolve user_id.
     Agents should be configured with proper authentication if needed.
+
+    Logs are queued and written in batches by log_buffer, so the response
+    (202 Accepted) does not include a log id.
     """
     try:
         # Ensure the requester is authorized to submit a log for the given username
         if current_user.username != log_data.username and current_user.role not in ("admin", "superadmin"):
             raise HTTPException(status_code=403, detail="Not authorized to submit logs for this user")
 
-        # Resolve username to user_id
-        user_id = get_user_id_by_username(log_data.username, db)
+        # Resolve username to user_id (only needs the DB when an admin submits for someone else)
+        if current_user.username == log_data.username:
+            user_id, user_role = current_user.id, current_user.role
+        else:
+            user_id, user_role = await run_in_threadpool(get_user_id_by_username, log_data.username)
 
-        # Create log record
-        log = Log(
-            user_id=user_id,
-            action=log_data.action,
-            details=log_data.details,
-            ip=log_data.ip,
-            device=log_data.device
-        )
-        db.add(log)
-        db.commit()
-        db.refresh(log)
+        now = now_ist()
+        await log_buffer.put({
+            "user_id": user_id,
+            "user_role": user_role,
+            "event_type": "AGENT_ACTIVITY",
+            "action": log_data.action,
+            "details": log_data.details,
+            "ip_address": log_data.ip,
+            "device": log_data.device,
+            "risk_score": 0.0,
+            "status": "normal",
+            "timestamp": now,
+            # Legacy fields
+            "ip": log_data.ip,
+            "time": now
+        })
 
         return {
-            "message": "Log stored successfully",
-            "log_id": log.id,
-            "user_id": log.user_id,
-            "action": log.action,
-            "time": log.time
+            "message": "Log accepted",
+            "user_id": user_id,
+            "action": log_data.action,
+            "time": now
         }
     except HTTPException:
-        db.rollback()
         raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error storing log: {str(e)}")
 
 # ---------------- View Logs (Admin Only) ----------------
 @app.get("/logs", response_model=list[LogResponse])
 def get_logs(
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of logs to skip"),
     limit: int = Query(50, ge=1, le=500, description="Number of logs to return (max 500)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (replaces skip)"),
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
@@ -1241,21 +1595,25 @@ def get_logs(
 
         # Admins can only see logs for users with role == "user"
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == Log.user_id).filter(models.User.role == "user")
+            query = query.filter(Log.user_role == "user")
 
-        logs = query.order_by(Log.time.desc()).offset(skip).limit(limit).all()
+        logs = fetch_logs_page(query, skip, limit, cursor, response)
         return logs
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching logs: {str(e)}")
 
 # ---------------- Search Logs (Admin Only) ----------------
 @app.get("/logs/search", response_model=list[LogResponse])
 def search_logs(
+    response: Response,
     action: str = Query(None, description="Filter by action type"),
     user_id: int = Query(None, description="Filter by user_id"),
     ip: str = Query(None, description="Filter by IP address"),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (replaces skip)"),
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
@@ -1265,7 +1623,7 @@ def search_logs(
 
         # Admins can only see logs for users with role == "user"
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == Log.user_id).filter(models.User.role == "user")
+            query = query.filter(Log.user_role == "user")
         
         if action:
             query = query.filter(Log.action.ilike(f"%{action}%"))
@@ -1274,8 +1632,10 @@ def search_logs(
         if ip:
             query = query.filter(Log.ip == ip)
         
-        logs = query.order_by(Log.time.desc()).offset(skip).limit(limit).all()
+        logs = fetch_logs_page(query, skip, limit, cursor, response)
         return logs
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching logs: {str(e)}")
 
@@ -1289,8 +1649,10 @@ def admin_profile(current_user=Depends(admin_required)):
 # ---------------- Admin Logs (alias) ----------------
 @app.get("/admin/logs", response_model=list[LogResponse])
 def admin_logs(
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of logs to skip"),
     limit: int = Query(50, ge=1, le=500, description="Number of logs to return (max 500)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page (replaces skip)"),
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
@@ -1300,15 +1662,23 @@ def admin_logs(
 
         # Admins can only see logs for users with role == "user"
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == Log.user_id).filter(models.User.role == "user")
+            query = query.filter(Log.user_role == "user")
 
-        logs = query.order_by(Log.time.desc()).offset(skip).limit(limit).all()
+        logs = fetch_logs_page(query, skip, limit, cursor, response)
         return logs
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching admin logs: {str(e)}")
 
 
 # ---------------- Admin Logs (enhanced) ----------------
+# Log columns behind EnhancedLogResponse; the enhanced listings select just
+# these and return the row mappings (serialized by the response_model like
+# every other log listing)
+_ENHANCED_LOG_COLUMNS = tuple(getattr(Log, field) for field in EnhancedLogResponse.model_fields)
+
+
 @app.get("/admin/logs/enhanced", response_model=list[EnhancedLogResponse])
 def admin_logs_enhanced(
     skip: int = Query(0, ge=0, description="Number of logs to skip"),
@@ -1320,22 +1690,41 @@ def admin_logs_enhanced(
 ):
     """Admin endpoint to fetch enhanced logs with risk scoring"""
     try:
-        query = db.query(Log)
+        query = select(*_ENHANCED_LOG_COLUMNS)
 
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == Log.user_id).filter(models.User.role == "user")
+            query = query.where(Log.user_role == "user")
 
         if status:
-            query = query.filter(Log.status == status)
+            query = query.where(Log.status == status)
         if event_type:
-            query = query.filter(Log.event_type == event_type)
+            query = query.where(Log.event_type == event_type)
 
-        logs = query.order_by(Log.timestamp.desc()).offset(skip).limit(limit).all()
-        return logs
+        logs = db.execute(query.order_by(Log.timestamp.desc()).offset(skip).limit(limit)).mappings()
+        return [dict(log) for log in logs]
     except Exception:
         raise HTTPException(status_code=500, detail="Unable to fetch enhanced logs")
 
 
+_LOG_CSV_HEADER = (
+    "id", "user_id", "event_type", "action", "details", "ip_address",
+    "location", "device", "browser", "os", "risk_score", "status", "timestamp"
+)
+_log_csv_leading = attrgetter("id", "user_id", "event_type", "action", "details")
+_log_csv_trailing = attrgetter("location", "device", "browser", "os", "risk_score", "status")
+
+
+def _log_csv_row(log) -> tuple:
+    """One export CSV row for a log, in _LOG_CSV_HEADER order"""
+    ts = log.timestamp or log.time
+    return (
+        *_log_csv_leading(log),
+        log.ip_address or log.ip,
+        *_log_csv_trailing(log),
+        ts.isoformat() if ts else ""
+    )
+
+
 @app.get("/admin/logs/export")
 def export_logs_csv(
     event_type: str = Query(None, description="Filter by event type"),
@@ -1352,7 +1741,7 @@ def export_logs_csv(
         query = db.query(Log)
 
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == Log.user_id).filter(models.User.role == "user")
+            query = query.filter(Log.user_role == "user")
 
         if user_id:
             query = query.filter(Log.user_id == user_id)
@@ -1373,43 +1762,66 @@ def export_logs_csv(
         if end_dt:
             query = query.filter(Log.timestamp <= end_dt)
 
-        logs = query.order_by(Log.timestamp.desc()).all()
+        # Rows are fetched in batches while the response is being sent rather
+        # than loading the whole result set up front
+        logs = query.order_by(Log.timestamp.desc()).yield_per(1000)
 
         import csv
         from io import StringIO
         from fastapi.responses import StreamingResponse
 
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "id", "user_id", "event_type", "action", "details", "ip_address",
-            "location", "device", "browser", "os", "risk_score", "status", "timestamp"
-        ])
-        for log in logs:
-            writer.writerow([
-                log.id,
-                log.user_id,
-                log.event_type,
-                log.action,
-                log.details,
-                log.ip_address or log.ip,
-                log.location,
-                log.device,
-                log.browser,
-                log.os,
-                log.risk_score,
-                log.status,
-                (log.timestamp or log.time).isoformat() if (log.timestamp or log.time) else ""
-            ])
-
-        output.seek(0)
+        rows = map(_log_csv_row, logs)
+        first_batch = list(islice(rows, 1000))
+
+        def generate_csv():
+            output = StringIO()
+            writer = csv.writer(output)
+            writer.writerow(_LOG_CSV_HEADER)
+            # Write and flush 1000 rows at a time
+            batch = first_batch
+            while batch:
+                writer.writerows(batch)
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+                batch = list(islice(rows, 1000))
+            yield output.getvalue()
+
         headers = {"Content-Disposition": "attachment; filename=admin_logs_export.csv"}
-        return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers=headers)
+
+        # Everything fit in the first batch: send it as one body with a
+        # Content-Length instead of going through the streaming machinery
+        if len(first_batch) < 1000:
+            content = "".join(generate_csv()).encode("utf-8")
+            return Response(content=content, media_type="text/csv", headers=headers)
+
+        return StreamingResponse(generate_csv(), media_type="text/csv", headers=headers)
     except Exception:
         raise HTTPException(status_code=500, detail="Unable to export logs")
 
 
 # ---------------- Get All Users (Admin Only) ----------------
+# User columns behind AdminUserOut; the admin user listings select just these
+# instead of loading full User instances (password hash, photo data, ...)
+_ADMIN_USER_FIELDS = tuple(UserResponse.model_fields)
+_ADMIN_USER_COLUMNS = tuple(getattr(models.User, field) for field in _ADMIN_USER_FIELDS)
+
+
+def _admin_users_page(db: Session, query, page: int, limit: int) -> dict:
+    """One AdminUsersResponse page of a filtered _ADMIN_USER_COLUMNS query"""
+    rows, total = fetch_page(query.order_by(models.User.id.asc()), (page - 1) * limit, limit)
+    data = [dict(zip(_ADMIN_USER_FIELDS, row)) for row in rows]
+
+    session_counts = count_active_sessions(db, [user_data["id"] for user_data in data])
+    for user_data in data:
+        user_data["active_session_count"] = session_counts.get(user_data["id"], 0)
+
+    return {
+        "data": data,
+        "pagination": build_pagination(total, page, limit)
+    }
+
+
 @app.get("/admin/users", response_model=AdminUsersResponse)
 def get_all_users(
     search: str = Query(None, description="Search by username or name"),
@@ -1426,7 +1838,7 @@ def get_all_users(
         role_value = role.strip() if role else None
 
         # Base user query
-        user_query = db.query(models.User)
+        user_query = db.query(*_ADMIN_USER_COLUMNS)
 
         # Admins can only see regular users
         if current_user.role == "admin":
@@ -1439,47 +1851,9 @@ def get_all_users(
             user_query = user_query.filter(models.User.role == role_value)
 
         if search_value:
-            like = f"%{search_value}%"
-            user_query = user_query.filter(
-                (models.User.username.ilike(like)) |
-                (models.User.name.ilike(like)) |
-                (models.User.company_email.ilike(like)) |
-                (models.User.personal_email.ilike(like))
-            )
-
-        total = user_query.with_entities(func.count(models.User.id)).scalar() or 0
-        offset = (page - 1) * limit
-
-        active_sessions_subq = (
-            db.query(
-                models.Session.user_id.label("user_id"),
-                func.count(models.Session.id).label("active_session_count")
-            )
-            .filter(models.Session.is_active == True)
-            .group_by(models.Session.user_id)
-            .subquery()
-        )
-
-        rows = (
-            user_query
-            .outerjoin(active_sessions_subq, models.User.id == active_sessions_subq.c.user_id)
-            .add_columns(func.coalesce(active_sessions_subq.c.active_session_count, 0).label("active_session_count"))
-            .order_by(models.User.id.asc())
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
+            user_query = user_query.filter(user_search_filter(search_value))
 
-        data = []
-        for user, active_session_count in rows:
-            user_data = AdminUserOut.model_validate(user).model_dump()
-            user_data["active_session_count"] = int(active_session_count or 0)
-            data.append(user_data)
-
-        return {
-            "data": data,
-            "pagination": build_pagination(total, page, limit)
-        }
+        return _admin_users_page(db, user_query, page, limit)
     except Exception:
         raise HTTPException(status_code=500, detail="Unable to fetch users")
 
@@ -1503,7 +1877,7 @@ def get_all_users_superadmin(
         search_value = search.strip() if search else None
         role_value = role.strip() if role else None
 
-        query = db.query(models.User)
+        query = db.query(*_ADMIN_USER_COLUMNS)
 
         if user_id:
             query = query.filter(models.User.id == user_id)
@@ -1512,49 +1886,45 @@ def get_all_users_superadmin(
             query = query.filter(models.User.role == role_value)
 
         if search_value:
-            like = f"%{search_value}%"
-            query = query.filter(
-                (models.User.username.ilike(like)) |
-                (models.User.name.ilike(like)) |
-                (models.User.company_email.ilike(like)) |
-                (models.User.personal_email.ilike(like))
-            )
+            query = query.filter(user_search_filter(search_value))
 
-        total = query.with_entities(func.count(models.User.id)).scalar() or 0
-        offset = (page - 1) * limit
+        return _admin_users_page(db, query, page, limit)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Unable to fetch users")
 
-        active_sessions_subq = (
-            db.query(
-                models.Session.user_id.label("user_id"),
-                func.count(models.Session.id).label("active_session_count")
-            )
-            .filter(models.Session.is_active == True)
-            .group_by(models.Session.user_id)
-            .subquery()
-        )
 
-        rows = (
-            query
-            .outerjoin(active_sessions_subq, models.User.id == active_sessions_subq.c.user_id)
-            .add_columns(func.coalesce(active_sessions_subq.c.active_session_count, 0).label("active_session_count"))
-            .order_by(models.User.id.asc())
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
-
-        data = []
-        for user, active_session_count in rows:
-            user_data = AdminUserOut.model_validate(user).model_dump()
-            user_data["active_session_count"] = int(active_session_count or 0)
-            data.append(user_data)
+def _set_account_locked(db: Session, user_id: int, lock: bool, now: datetime, only_if_changed: bool = False):
+    """
+    Lock or unlock a user with a single UPDATE ... RETURNING; locking also ends
+    the user's active sessions. Returns the user's (role, username) row, for
+    the audit log and the lookup cache, or None if no row was updated: the
+    user doesn't exist or, with only_if_changed, is already in the requested
+    state.
+    """
+    is_locked = or_(models.User.account_locked == True, models.User.status == "locked")
+    stmt = update(models.User).where(models.User.id == user_id)
+    if only_if_changed:
+        stmt = stmt.where(~is_locked if lock else is_locked)
+    if lock:
+        stmt = stmt.values(account_locked=True, status="locked", locked_at=now)
+    else:
+        stmt = stmt.values(account_locked=False, status="active", failed_login_attempts=0, locked_at=None)
+
+    updated = db.execute(
+        stmt.returning(models.User.role, models.User.username).execution_options(synchronize_session=False)
+    ).first()
+    if updated is None:
+        return None
 
-        return {
-            "data": data,
-            "pagination": build_pagination(total, page, limit)
-        }
-    except Exception:
-        raise HTTPException(status_code=500, detail="Unable to fetch users")
+    if lock:
+        # Terminate all active sessions
+        db.execute(
+            update(models.Session)
+            .where(models.Session.user_id == user_id, models.Session.is_active == True)
+            .values(is_active=False, logout_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    return updated
 
 
 # ---------------- Lock/Unlock User Account ----------------
@@ -1573,74 +1943,43 @@ def lock_unlock_user(
     import json
     
     try:
-        # Fetch target user
-        target_user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not target_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
+        # Single timestamp for every row this action writes
+        now = now_ist()
+
         # Prevent self-targeting
-        if target_user.id == current_user.id:
+        if user_id == current_user.id:
             raise HTTPException(status_code=400, detail="Cannot lock/unlock yourself")
         
         # Validate action
         if request_data.action not in ["lock", "unlock"]:
             raise HTTPException(status_code=400, detail="Action must be 'lock' or 'unlock'")
         
-        # Check if action is already in desired state
-        is_locked = target_user.account_locked or target_user.status == "locked"
-        if request_data.action == "lock" and is_locked:
-            raise HTTPException(status_code=400, detail="User is already locked")
-        if request_data.action == "unlock" and not is_locked:
-            raise HTTPException(status_code=400, detail="User is not locked")
-        
-        # SUPERADMIN: Execute directly
+        # SUPERADMIN: Execute directly. The state check is part of the UPDATE,
+        # so the target user doesn't need to be fetched first.
         if is_superadmin(current_user):
-            if request_data.action == "lock":
-                target_user.account_locked = True
-                target_user.status = "locked"
-                target_user.locked_at = now_ist()
-                
-                # Terminate all active sessions
-                db.query(models.Session).filter(
-                    models.Session.user_id == user_id,
-                    models.Session.is_active == True
-                ).update({"is_active": False, "logout_at": now_ist()})
-                
-                # Log the action
-                log = models.Log(
-                    user_id=user_id,
-                    event_type="ACCOUNT_LOCKED",
-                    action=f"Account locked by superadmin {current_user.username}",
-                    details=f"Reason: {request_data.reason or 'No reason provided'}",
-                    ip_address="system",
-                    ip="system",
-                    device="system",
-                    timestamp=now_ist(),
-                    status="critical"
-                )
-                db.add(log)
-                
-            else:  # unlock
-                target_user.account_locked = False
-                target_user.status = "active"
-                target_user.failed_login_attempts = 0
-                target_user.locked_at = None
-                
-                # Log the action
-                log = models.Log(
-                    user_id=user_id,
-                    event_type="ACCOUNT_UNLOCKED",
-                    action=f"Account unlocked by superadmin {current_user.username}",
-                    details=f"Reason: {request_data.reason or 'No reason provided'}",
-                    ip_address="system",
-                    ip="system",
-                    device="system",
-                    timestamp=now_ist(),
-                    status="normal"
-                )
-                db.add(log)
+            lock = request_data.action == "lock"
+            target = _set_account_locked(db, user_id, lock, now, only_if_changed=True)
+            if not target:
+                if not db.query(models.User.id).filter(models.User.id == user_id).first():
+                    raise HTTPException(status_code=404, detail="User not found")
+                raise HTTPException(status_code=400, detail="User is already locked" if lock else "User is not locked")
             
+            # Log the action
+            log = models.Log(
+                user_id=user_id,
+                user_role=target.role,
+                event_type="ACCOUNT_LOCKED" if lock else "ACCOUNT_UNLOCKED",
+                action=f"Account {request_data.action}ed by superadmin {current_user.username}",
+                details=f"Reason: {request_data.reason or 'No reason provided'}",
+                ip_address="system",
+                ip="system",
+                device="system",
+                timestamp=now,
+                status="critical" if lock else "normal"
+            )
+            db.add(log)
             db.commit()
+            _USER_LOOKUP_CACHE.pop(target.username, None)
             return {
                 "success": True,
                 "message": f"User {request_data.action}ed successfully",
@@ -1649,6 +1988,26 @@ def lock_unlock_user(
         
         # ADMIN: Create approval request
         else:
+            # Fetch only the columns the state check and request context use
+            target_user = db.query(models.User).with_entities(
+                models.User.username,
+                models.User.company_email,
+                models.User.role,
+                models.User.failed_login_attempts,
+                models.User.last_login_country,
+                models.User.account_locked,
+                models.User.status
+            ).filter(models.User.id == user_id).first()
+            if not target_user:
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            # Check if action is already in desired state
+            is_locked = target_user.account_locked or target_user.status == "locked"
+            if request_data.action == "lock" and is_locked:
+                raise HTTPException(status_code=400, detail="User is already locked")
+            if request_data.action == "unlock" and not is_locked:
+                raise HTTPException(status_code=400, detail="User is not locked")
+            
             # Calculate current risk score for context
             risk_score = 0.0
             if hasattr(target_user, 'failed_login_attempts') and target_user.failed_login_attempts >= 3:
@@ -1674,7 +2033,7 @@ def lock_unlock_user(
                 risk_score=risk_score,
                 user_details=user_details,
                 status="pending",
-                created_at=now_ist()
+                created_at=now
             )
             db.add(lock_request)
             db.commit()
@@ -1711,25 +2070,29 @@ def get_pending_requests(
             models.LockUnlockRequest.status == "pending"
         )
         
-        total = query.with_entities(func.count(models.LockUnlockRequest.id)).scalar() or 0
         offset = (page - 1) * limit
         
-        requests = query.order_by(models.LockUnlockRequest.created_at.desc()).offset(offset).limit(limit).all()
+        # Join the target user and requester in the same query rather than
+        # looking each one up per row
+        TargetUser = aliased(models.User)
+        Requester = aliased(models.User)
+        rows, total = fetch_page(
+            query
+            .outerjoin(TargetUser, TargetUser.id == models.LockUnlockRequest.user_id)
+            .outerjoin(Requester, Requester.id == models.LockUnlockRequest.requested_by_id)
+            .add_columns(TargetUser.username, Requester.username)
+            .order_by(models.LockUnlockRequest.created_at.desc()),
+            offset,
+            limit
+        )
         
         # Enrich with usernames
-        data = []
-        for req in requests:
-            req_dict = LockUnlockRequestResponse.model_validate(req).model_dump()
-            
-            # Get target user
-            target_user = db.query(models.User).filter(models.User.id == req.user_id).first()
-            req_dict["target_username"] = target_user.username if target_user else "Unknown"
-            
-            # Get requester
-            requester = db.query(models.User).filter(models.User.id == req.requested_by_id).first()
-            req_dict["requested_by_username"] = requester.username if requester else "Unknown"
-            
-            data.append(req_dict)
+        data = _LOCK_REQUESTS_ADAPTER.dump_python(
+            _LOCK_REQUESTS_ADAPTER.validate_python([req for req, _, _ in rows], from_attributes=True)
+        )
+        for req_dict, (_, target_username, requester_username) in zip(data, rows):
+            req_dict["target_username"] = target_username or "Unknown"
+            req_dict["requested_by_username"] = requester_username or "Unknown"
         
         return {
             "data": data,
@@ -1755,6 +2118,9 @@ def review_request(
         raise HTTPException(status_code=400, detail="Action must be 'approve' or 'reject'")
     
     try:
+        # Single timestamp for every row this review writes
+        now = now_ist()
+
         # Fetch the request
         lock_request = db.query(models.LockUnlockRequest).filter(
             models.LockUnlockRequest.id == request_id
@@ -1769,62 +2135,34 @@ def review_request(
         # Update request status
         lock_request.status = "approved" if review.action == "approve" else "rejected"
         lock_request.reviewed_by_id = current_user.id
-        lock_request.reviewed_at = now_ist()
+        lock_request.reviewed_at = now
         lock_request.review_comment = review.comment
         
         # If approved, execute the action
         if review.action == "approve":
-            target_user = db.query(models.User).filter(models.User.id == lock_request.user_id).first()
-            
-            if not target_user:
+            lock = lock_request.action == "lock"
+            target = _set_account_locked(db, lock_request.user_id, lock, now)
+            if not target:
                 raise HTTPException(status_code=404, detail="Target user not found")
             
-            if lock_request.action == "lock":
-                target_user.account_locked = True
-                target_user.status = "locked"
-                target_user.locked_at = now_ist()
-                
-                # Terminate all active sessions
-                db.query(models.Session).filter(
-                    models.Session.user_id == lock_request.user_id,
-                    models.Session.is_active == True
-                ).update({"is_active": False, "logout_at": now_ist()})
-                
-                # Log the action
-                log = models.Log(
-                    user_id=lock_request.user_id,
-                    event_type="ACCOUNT_LOCKED",
-                    action=f"Account locked - Request approved by {current_user.username}",
-                    details=f"Requested by admin. Reason: {lock_request.reason or 'No reason provided'}",
-                    ip_address="system",
-                    ip="system",
-                    device="system",
-                    timestamp=now_ist(),
-                    status="critical"
-                )
-                db.add(log)
-                
-            else:  # unlock
-                target_user.account_locked = False
-                target_user.status = "active"
-                target_user.failed_login_attempts = 0
-                target_user.locked_at = None
-                
-                # Log the action
-                log = models.Log(
-                    user_id=lock_request.user_id,
-                    event_type="ACCOUNT_UNLOCKED",
-                    action=f"Account unlocked - Request approved by {current_user.username}",
-                    details=f"Requested by admin. Reason: {lock_request.reason or 'No reason provided'}",
-                    ip_address="system",
-                    ip="system",
-                    device="system",
-                    timestamp=now_ist(),
-                    status="normal"
-                )
-                db.add(log)
+            # Log the action
+            log = models.Log(
+                user_id=lock_request.user_id,
+                user_role=target.role,
+                event_type="ACCOUNT_LOCKED" if lock else "ACCOUNT_UNLOCKED",
+                action=f"Account {lock_request.action}ed - Request approved by {current_user.username}",
+                details=f"Requested by admin. Reason: {lock_request.reason or 'No reason provided'}",
+                ip_address="system",
+                ip="system",
+                device="system",
+                timestamp=now,
+                status="critical" if lock else "normal"
+            )
+            db.add(log)
         
         db.commit()
+        if review.action == "approve":
+            _USER_LOOKUP_CACHE.pop(target.username, None)
         
         return {
             "success": True,
@@ -1843,7 +2181,7 @@ def review_request(
 # ---------------- Standard Users endpoints (Admin Only) ----------------
 @app.get("/users", response_model=list[UserResponse])
 def get_users(
-    search: str = Query(None, description="Search by username or name"),
+    search: str = Query(None, description="Search by username, name or email"),
     user_id: int = Query(None, description="Filter by user id"),
     skip: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=2000),
@@ -1852,7 +2190,9 @@ def get_users(
 ):
     """Alias for /admin/users to satisfy standard endpoint naming"""
     try:
-        query = db.query(models.User)
+        # Only the response's columns, as in /admin/users; rows aren't loaded
+        # as ORM instances just to be serialized
+        query = db.query(*_ADMIN_USER_COLUMNS)
 
         # Admins can only see regular users
         if current_user.role == "admin":
@@ -1862,13 +2202,10 @@ def get_users(
             query = query.filter(models.User.id == user_id)
 
         if search:
-            like = f"%{search}%"
-            query = query.filter(
-                (models.User.username.ilike(like)) | (models.User.name.ilike(like))
-            )
+            query = query.filter(user_search_filter(search))
 
-        users = query.order_by(models.User.id.asc()).offset(skip).limit(limit).all()
-        return users
+        rows = query.order_by(models.User.id.asc()).offset(skip).limit(limit).all()
+        return [dict(zip(_ADMIN_USER_FIELDS, row)) for row in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
@@ -1877,15 +2214,16 @@ def get_users(
 def get_user_by_id(user_id: int, db: Session = Depends(get_db), current_user=Depends(admin_required)):
     """Fetch single user by id (admin only)"""
     try:
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
+        row = db.query(*_ADMIN_USER_COLUMNS).filter(models.User.id == user_id).first()
+        if not row:
             raise HTTPException(status_code=404, detail="User not found")
+        user_data = dict(zip(_ADMIN_USER_FIELDS, row))
 
         # Admins cannot view other admins or superadmins
-        if current_user.role == "admin" and user.role in ("admin", "superadmin"):
+        if current_user.role == "admin" and user_data["role"] in ("admin", "superadmin"):
             raise HTTPException(status_code=403, detail="Not authorized to view admin users")
 
-        return user
+        return user_data
     except HTTPException:
         raise
     except Exception as e:
@@ -1893,6 +2231,65 @@ def get_user_by_id(user_id: int, db: Session = Depends(get_db), current_user=Dep
 
 
 # ---------------- User-specific Logs (Admin Only) ----------------
+def fetch_user_logs(
+    db: Session,
+    current_user,
+    user_id: int,
+    *,
+    event_type: Optional[str] = None,
+    suspicious: bool = False,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page: int = 1,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> dict:
+    """Filtered, paginated logs for one user; shared by both user-log routes"""
+    user = db.query(models.User.id, models.User.username, models.User.role).filter(
+        models.User.id == user_id
+    ).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if current_user.role == "admin" and user.role in ("admin", "superadmin"):
+        raise HTTPException(status_code=403, detail="Not authorized to view admin logs")
+
+    query = db.query(Log).filter(Log.user_id == user_id)
+
+    if event_type:
+        query = query.filter(Log.event_type == event_type.strip())
+
+    if suspicious:
+        query = query.filter(Log.status == "suspicious")
+
+    start_dt = parse_iso_datetime(start_date)
+    end_dt = parse_iso_datetime(end_date)
+    if start_dt:
+        query = query.filter(Log.timestamp >= start_dt)
+    if end_dt:
+        query = query.filter(Log.timestamp <= end_dt)
+
+    ordered = query.order_by(Log.timestamp.desc(), Log.id.desc())
+
+    if cursor:
+        # Seek past the cursor row; no OFFSET scan and no total count
+        logs = seek_before(ordered, Log.timestamp, Log.id, *decode_cursor(cursor)).limit(limit).all()
+        pagination = None
+    else:
+        offset = (page - 1) * limit
+        logs, total = fetch_page(ordered, offset, limit)
+        pagination = build_pagination(total, page, limit)
+
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "role": user.role,
+        "data": logs,
+        "pagination": pagination,
+        "next_cursor": next_page_cursor(logs, limit, "timestamp")
+    }
+
+
 @app.get("/admin/users/{user_id}/logs", response_model=AdminUserLogsResponse)
 def get_admin_user_logs(
     user_id: int,
@@ -1902,52 +2299,29 @@ def get_admin_user_logs(
     end_date: str = Query(None, description="End date (ISO 8601)"),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (replaces page)"),
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
     """Return logs for a user with filters and pagination (admin only)"""
     try:
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        if current_user.role == "admin" and user.role in ("admin", "superadmin"):
-            raise HTTPException(status_code=403, detail="Not authorized to view admin logs")
-
-        query = db.query(Log).filter(Log.user_id == user_id)
-
-        if event_type:
-            query = query.filter(Log.event_type == event_type.strip())
-
-        if suspicious:
-            query = query.filter(Log.status == "suspicious")
-
-        start_dt = parse_iso_datetime(start_date)
-        end_dt = parse_iso_datetime(end_date)
-        if start_dt:
-            query = query.filter(Log.timestamp >= start_dt)
-        if end_dt:
-            query = query.filter(Log.timestamp <= end_dt)
-
-        total = query.with_entities(func.count(Log.id)).scalar() or 0
-        offset = (page - 1) * limit
-
-        logs = query.order_by(Log.timestamp.desc()).offset(offset).limit(limit).all()
-
-        return {
-            "user_id": user.id,
-            "username": user.username,
-            "role": user.role,
-            "data": logs,
-            "pagination": build_pagination(total, page, limit)
-        }
+        return fetch_user_logs(
+            db, current_user, user_id,
+            event_type=event_type,
+            suspicious=suspicious,
+            start_date=start_date,
+            end_date=end_date,
+            page=page,
+            limit=limit,
+            cursor=cursor
+        )
     except HTTPException:
         raise
     except Exception:
         raise HTTPException(status_code=500, detail="Unable to fetch user logs")
 
 
-@app.get("/users/{user_id}/logs")
+@app.get("/users/{user_id}/logs", response_model=AdminUserLogsResponse)
 def get_user_logs_alias(
     user_id: int,
     skip: int = Query(0, ge=0),
@@ -1956,7 +2330,12 @@ def get_user_logs_alias(
     current_user=Depends(admin_required)
 ):
     """Alias endpoint for /admin/users/{user_id}/logs - Returns logs with username and count"""
-    return get_admin_user_logs(user_id, skip, limit, db, current_user)
+    try:
+        return fetch_user_logs(db, current_user, user_id, page=skip // limit + 1, limit=limit)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=500, detail="Unable to fetch user logs")
 
 # =============================================================================
 # PHASE 1: Session Management Endpoints
@@ -2009,10 +2388,48 @@ def get_session_details(
         raise HTTPException(status_code=500, detail=f"Error fetching session: {str(e)}")
 
 
+async def log_session_termination(
+    user_id: int,
+    user_role: Optional[str],
+    action: str,
+    details: str,
+    ip_address: str,
+    user_agent: str,
+    now: datetime
+) -> None:
+    """
+    Audit-log a terminated session (run as a background task).
+
+    The geolocation lookup is only needed for this log row, so it happens
+    after the response has been sent; the row goes through log_buffer.
+    """
+    user_agent_info = parse_user_agent(user_agent)
+    location_data = await get_location_from_ip(ip_address)
+    await log_buffer.put({
+        "user_id": user_id,
+        "user_role": user_role,
+        "event_type": "SESSION_TERMINATED",
+        "action": action,
+        "details": details,
+        "ip_address": ip_address,
+        "location": get_location_string(location_data),
+        "device": user_agent_info.get("device", "Unknown"),
+        "browser": user_agent_info.get("browser"),
+        "os": user_agent_info.get("os"),
+        "risk_score": 0.0,
+        "status": "normal",
+        "timestamp": now,
+        # Legacy fields
+        "ip": ip_address,
+        "time": now
+    })
+
+
 @app.delete("/sessions/{session_id}")
 async def terminate_session(
     session_id: str,
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -2032,32 +2449,24 @@ async def terminate_session(
             raise HTTPException(status_code=404, detail="Active session not found")
         
         # Close session
-        session.logout_at = now_ist()
+        now = now_ist()
+        session.logout_at = now
         session.is_active = False
+        # current_user shares this session, so read it before commit expires it
+        user_id, user_role = current_user.id, current_user.role
+        db.commit()
         
-        # Log session termination
-        ip_address = get_client_ip(request)
-        user_agent_info = get_user_agent_info(request)
-        location_data = await get_location_from_ip(ip_address)
-        location_string = get_location_string(location_data)
-        
-        terminate_log = models.Log(
-            user_id=current_user.id,
-            event_type="SESSION_TERMINATED",
-            action="Remote Session Termination",
-            details=f"Session {session_id} terminated remotely",
-            ip_address=ip_address,
-            location=location_string,
-            device=user_agent_info.get("device", "Unknown"),
-            browser=user_agent_info.get("browser"),
-            os=user_agent_info.get("os"),
-            risk_score=0.0,
-            status="normal",
-            ip=ip_address,
-            time=now_ist()
+        # Log session termination once the response is out
+        background_tasks.add_task(
+            log_session_termination,
+            user_id,
+            user_role,
+            "Remote Session Termination",
+            f"Session {session_id} terminated remotely",
+            get_client_ip(request),
+            request.headers.get("User-Agent", "Unknown"),
+            now
         )
-        db.add(terminate_log)
-        db.commit()
         
         return {"message": "Session terminated successfully", "session_id": session_id}
     except HTTPException:
@@ -2081,16 +2490,17 @@ def get_enhanced_logs(
     Returns logs with event_type, risk_score, location, browser/OS info
     """
     try:
-        query = db.query(models.Log).filter(models.Log.user_id == current_user.id)
+        # Only the response columns, as plain row mappings: no ORM objects
+        query = select(*_ENHANCED_LOG_COLUMNS).where(models.Log.user_id == current_user.id)
         
         if event_type:
-            query = query.filter(models.Log.event_type == event_type)
+            query = query.where(models.Log.event_type == event_type)
         
         if status:
-            query = query.filter(models.Log.status == status)
+            query = query.where(models.Log.status == status)
         
-        logs = query.order_by(models.Log.timestamp.desc()).limit(limit).all()
-        return logs
+        logs = db.execute(query.order_by(models.Log.timestamp.desc()).limit(limit)).mappings()
+        return [dict(log) for log in logs]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching enhanced logs: {str(e)}")
 
@@ -2101,6 +2511,7 @@ def get_all_sessions(
     active_only: bool = Query(True, description="Show only active sessions"),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (replaces page)"),
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
@@ -2110,9 +2521,12 @@ def get_all_sessions(
     try:
         query = db.query(models.Session)
 
-        # Admins can only see sessions for users with role == "user"
+        # Admins can only see sessions for users with role == "user". A semi-join
+        # on the role index keeps the query on Session alone (no row fan-out).
         if current_user.role == "admin":
-            query = query.join(models.User, models.User.id == models.Session.user_id).filter(models.User.role == "user")
+            query = query.filter(models.Session.user_id.in_(
+                select(models.User.id).where(models.User.role == "user")
+            ))
         
         if user_id:
             query = query.filter(models.Session.user_id == user_id)
@@ -2120,14 +2534,26 @@ def get_all_sessions(
         if active_only:
             query = query.filter(models.Session.is_active == True)
 
-        total = query.with_entities(func.count(models.Session.id)).scalar() or 0
-        offset = (page - 1) * limit
+        query = query.order_by(models.Session.login_at.desc(), models.Session.id.desc())
+
+        if cursor:
+            # Seek past the cursor row; no OFFSET scan and no total count
+            sessions = seek_before(
+                query, models.Session.login_at, models.Session.id, *decode_cursor(cursor)
+            ).limit(limit).all()
+            pagination = None
+        else:
+            offset = (page - 1) * limit
+            sessions, total = fetch_page(query, offset, limit)
+            pagination = build_pagination(total, page, limit)
 
-        sessions = query.order_by(models.Session.login_at.desc()).offset(offset).limit(limit).all()
         return {
             "data": sessions,
-            "pagination": build_pagination(total, page, limit)
+            "pagination": pagination,
+            "next_cursor": next_page_cursor(sessions, limit, "login_at")
         }
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=500, detail="Unable to fetch sessions")
 
@@ -2136,50 +2562,46 @@ def get_all_sessions(
 async def force_logout_session(
     session_id: str,
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(admin_required)
 ):
     """Admin: Force logout a user session"""
     try:
-        session = db.query(models.Session).filter(
+        # The target's role comes back with the session in one query
+        row = db.query(models.Session, models.User.role).outerjoin(
+            models.User, models.User.id == models.Session.user_id
+        ).filter(
             models.Session.session_id == session_id,
             models.Session.is_active == True
         ).first()
 
-        if not session:
+        if not row:
             raise HTTPException(status_code=404, detail="Active session not found")
 
+        session, target_role = row
+        target_user_id = session.user_id
+
         # Admins cannot terminate other admin/superadmin sessions
-        if current_user.role == "admin":
-            target_user = db.query(models.User).filter(models.User.id == session.user_id).first()
-            if target_user and target_user.role in ("admin", "superadmin"):
-                raise HTTPException(status_code=403, detail="Not authorized to terminate admin sessions")
+        if current_user.role == "admin" and target_role in ("admin", "superadmin"):
+            raise HTTPException(status_code=403, detail="Not authorized to terminate admin sessions")
 
-        session.logout_at = now_ist()
+        now = now_ist()
+        session.logout_at = now
         session.is_active = False
+        db.commit()
 
-        ip_address = get_client_ip(request)
-        user_agent_info = get_user_agent_info(request)
-        location_data = await get_location_from_ip(ip_address)
-        location_string = get_location_string(location_data)
-
-        log = models.Log(
-            user_id=session.user_id,
-            event_type="SESSION_TERMINATED",
-            action="Admin Force Logout",
-            details=f"Session {session_id} terminated by admin",
-            ip_address=ip_address,
-            location=location_string,
-            device=user_agent_info.get("device", "Unknown"),
-            browser=user_agent_info.get("browser"),
-            os=user_agent_info.get("os"),
-            risk_score=0,
-            status="normal",
-            ip=ip_address,
-            time=now_ist()
+        # Log the force logout once the response is out
+        background_tasks.add_task(
+            log_session_termination,
+            target_user_id,
+            target_role,
+            "Admin Force Logout",
+            f"Session {session_id} terminated by admin",
+            get_client_ip(request),
+            request.headers.get("User-Agent", "Unknown"),
+            now
         )
-        db.add(log)
-        db.commit()
 
         return {"message": "Session terminated", "session_id": session_id}
     except HTTPException:
@@ -2237,14 +2659,11 @@ def get_login_history(
         if min_risk_score is not None:
             query = query.filter(models.Session.risk_score >= min_risk_score)
 
-        # Get total count
-        total = query.with_entities(func.count(models.Session.id)).scalar() or 0
-
         # Calculate pagination
         offset = (page - 1) * limit
 
-        # Fetch sessions with ordering (most recent first)
-        results = query.order_by(models.Session.login_at.desc()).offset(offset).limit(limit).all()
+        # Fetch sessions with ordering (most recent first) and the total count
+        results, total = fetch_page(query.order_by(models.Session.login_at.desc()), offset, limit)
         
         # Transform results to include username
         sessions_data = []
@@ -2317,7 +2736,7 @@ async def register_device(
     Register a new device for the authenticated user
     
     Security Rules:
-    - Device UUID must be at least 32 characters
+    - Device UUID must be 32-128 URL-safe characters (checked by DeviceRegister)
     - If device_uuid exists for current user → return existing device
     - If device_uuid exists for another user → reject with 403
     - Auto-set trust_score=100.0 and is_active=True
@@ -2329,32 +2748,36 @@ async def register_device(
         "/matic timestamp management
     """
     try:
-        # Validate device UUID length
-        if len(device_data.device_uuid) < 32:
-            raise HTTPException(
-                status_code=400,
-                detail="Device UUID must be at least 32 characters"
+        # One timestamp for every column this request stamps
+        now = now_ist()
+
+        # Re-registration of the user's own device (every app launch): bump
+        # last_seen_at and read the response columns back in one UPDATE ... RETURNING
+        existing_device = db.execute(
+            update(Device)
+            .where(Device.device_uuid == device_data.device_uuid, Device.user_id == current_user.id)
+            .values(last_seen_at=now)
+            .returning(
+                Device.id, Device.device_uuid, Device.device_name, Device.os,
+                Device.trust_score, Device.is_active,
+                Device.first_registered_at, Device.last_seen_at
             )
-        
-        # Check if device already exists
-        existing_device = db.query(Device).filter(
-            Device.device_uuid == device_data.device_uuid
+            .execution_options(synchronize_session=False)
         ).first()
         
         if existing_device:
-            # If device belongs to current user, update last_seen and return
-            if existing_device.user_id == current_user.id:
-                existing_device.last_seen_at = now_ist()
-                db.commit()
-                db.refresh(existing_device)
-                
-                return existing_device
-            else:
-                # Device belongs to another user - security violation
-                raise HTTPException(
-                    status_code=403,
-                    detail="Device UUID already registered to another user"
-                )
+            db.commit()
+            return existing_device
+        
+        # No row updated: either the UUID is new or it belongs to another user
+        if db.query(
+            select(Device.id).where(Device.device_uuid == device_data.device_uuid).exists()
+        ).scalar():
+            # Device belongs to another user - security violation
+            raise HTTPException(
+                status_code=403,
+                detail="Device UUID already registered to another user"
+            )
         
         # Create new device
         new_device = Device(
@@ -2362,8 +2785,8 @@ async def register_device(
             device_uuid=device_data.device_uuid,
             device_name=device_data.device_name,
             os=device_data.os,
-            first_registered_at=now_ist(),
-            last_seen_at=now_ist(),
+            first_registered_at=now,
+            last_seen_at=now,
             is_active=True,
             trust_score=100.0
         )
@@ -2379,6 +2802,7 @@ async def register_device(
         # Create registration log
         registration_log = Log(
             user_id=current_user.id,
+            user_role=current_user.role,
             event_type="DEVICE_REGISTERED",
             action="Device Registration",
             details=f"New device registered: {device_data.device_name} (UUID: {device_data.device_uuid[:16]}...)",
@@ -2390,16 +2814,23 @@ async def register_device(
             risk_score=0.0,
             status="normal",
             ip=ip_address,
-            time=now_ist(),
-            timestamp=now_ist()
+            time=now,
+            timestamp=now
         )
         db.add(registration_log)
         
-        # Commit all changes
+        # Flush assigns the device id; serialize before commit expires the
+        # instance, so it isn't reloaded
+        db.flush()
+        device_response = {field: getattr(new_device, field) for field in DeviceResponse.model_fields}
+        # Naive, as SQLite stores them and the re-registration RETURNING
+        # path above reads them back
+        for field in ("first_registered_at", "last_seen_at"):
+            device_response[field] = device_response[field].replace(tzinfo=None)
         db.commit()
-        db.refresh(new_device)
+        _AGENT_DEVICES_CACHE.clear()
         
-        return new_device
+        return device_response
         
     except HTTPException:
         raise
@@ -2428,6 +2859,9 @@ async def register_agent(
     Returns agent_token for subsequent heartbeat authentication.
     """
     try:
+        # One timestamp for every column this request stamps
+        now = now_ist()
+
         device_uuid = request_data.device_uuid.strip()
         
         if not device_uuid:
@@ -2441,20 +2875,22 @@ async def register_agent(
             new_token = secrets.token_hex(64)  # 128 characters
             
             # Update last_seen and store new token hash
-            existing_device.last_seen_at = now_ist()
+            existing_device.last_seen_at = now
             existing_device.agent_token_hash = hash_agent_token(new_token)
+            # Read what the response needs before commit expires the instance
+            device_id = existing_device.id
+            is_approved = bool(existing_device.is_approved)
             db.commit()
-            db.refresh(existing_device)
             
-            logger.info(f"Agent re-registered: Device {device_uuid[:16]}... (ID: {existing_device.id})")
+            logger.info(f"Agent re-registered: Device {device_uuid[:16]}... (ID: {device_id})")
             
-            return AgentRegisterResponse(
-                agent_token=new_token,
-                device_id=existing_device.id,
-                registered_at=now_ist(),
-                is_approved=bool(existing_device.is_approved),
-                heartbeat_interval=30
-            )
+            return {
+                "agent_token": new_token,
+                "device_id": device_id,
+                "registered_at": now,
+                "is_approved": is_approved,
+                "heartbeat_interval": 30
+            }
         
         # Create new device record
         new_device = Device(
@@ -2466,8 +2902,8 @@ async def register_agent(
             os=request_data.os_version.split()[0] if request_data.os_version else None,
             is_active=True,
             trust_score=100.0,
-            first_registered_at=now_ist(),
-            last_seen_at=now_ist()
+            first_registered_at=now,
+            last_seen_at=now
         )
         
         # Generate and store 128-char hex agent token
@@ -2476,14 +2912,18 @@ async def register_agent(
         new_device.agent_token_hash = hash_agent_token(agent_token)
         
         db.add(new_device)
-        db.commit()
-        db.refresh(new_device)
+        # Flush assigns the device id (and column defaults); the device and its
+        # registration log are then committed together
+        db.flush()
+        device_id = new_device.id
+        is_approved = bool(new_device.is_approved)
         
-        logger.info(f"Agent registered: Device {device_uuid[:16]}... (ID: {new_device.id}) from {request_data.hostname}")
+        logger.info(f"Agent registered: Device {device_uuid[:16]}... (ID: {device_id}) from {request_data.hostname}")
         
         # Create registration log
         registration_log = Log(
             user_id=None,
+            user_role=None,
             event_type="AGENT_REGISTERED",
             action="Endpoint Agent Registration",
             details=f"New agent device registered: {request_data.hostname} ({request_data.os_version})",
@@ -2491,18 +2931,19 @@ async def register_agent(
             device=request_data.hostname,
             risk_score=0.0,
             status="normal",
-            timestamp=now_ist()
+            timestamp=now
         )
         db.add(registration_log)
         db.commit()
+        _AGENT_DEVICES_CACHE.clear()
         
-        return AgentRegisterResponse(
-            agent_token=agent_token,
-            device_id=new_device.id,
-            registered_at=now_ist(),
-            is_approved=bool(new_device.is_approved),
-            heartbeat_interval=30
-        )
+        return {
+            "agent_token": agent_token,
+            "device_id": device_id,
+            "registered_at": now,
+            "is_approved": is_approved,
+            "heartbeat_interval": 30
+        }
         
     except HTTPException:
         raise
@@ -2519,7 +2960,7 @@ async def register_agent(
 async def receive_agent_heartbeat(
     heartbeat: AgentHeartbeatRequest,
     request: Request,
-    authorization: Optional[str] = Header(default=None),
+    token: str = Depends(get_agent_token),
     db: Session = Depends(get_db)
 ):
     """
@@ -2534,16 +2975,15 @@ async def receive_agent_heartbeat(
     Requires Authorization header: Bearer <agent_token>
     """
     try:
-        # Extract and validate token
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-        
-        token = authorization.replace("Bearer ", "").strip()
-        
-        # Validate token format (128-char hex for agent tokens)
-        if len(token) != 128:
-            raise HTTPException(status_code=401, detail="Invalid token format")
-        
+        # Throttle per token before any DB work, so a looping or hostile agent
+        # can't turn heartbeats into a stream of telemetry writes
+        allowed, error_msg = check_rate_limit_token(hash_agent_token(token))
+        if not allowed:
+            raise HTTPException(status_code=429, detail=error_msg)
+
+        # One timestamp for every column this request stamps
+        now = now_ist()
+
         device_uuid = heartbeat.device_uuid.strip()
         
         # Find device by UUID
@@ -2557,27 +2997,23 @@ async def receive_agent_heartbeat(
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         
         # Update device last_seen
-        device.last_seen_at = now_ist()
+        device.last_seen_at = now
         
-        # Store telemetry snapshot
-        metrics_json = json.dumps(heartbeat.metrics.dict(exclude_none=True), default=str)
-        
-        telemetry = Telemetry(
-            device_id=device.id,
-            collected_at=ensure_ist(heartbeat.timestamp) if heartbeat.timestamp else now_ist(),
-            metrics=metrics_json,
-            sample_count=1
-        )
-        
-        db.add(telemetry)
+        # Store telemetry snapshot. The row is append-only and nothing below
+        # reads it back, so it goes through the batched writer instead of
+        # this request's transaction.
+        await telemetry_buffer.put({
+            "device_id": device.id,
+            "collected_at": ensure_ist(heartbeat.timestamp) if heartbeat.timestamp else now,
+            "metrics": heartbeat.metrics.model_dump(exclude_none=True),
+            "sample_count": 1
+        })
         
         # Calculate updated trust_score
         suspicious_flag = False  # Can be set based on telemetry analysis
         
         # Simple anomaly detection: high CPU or memory usage could be suspicious
-        if heartbeat.metrics.cpu and heartbeat.metrics.cpu.get("percent", 0) > 95:
-            suspicious_flag = True
-        if heartbeat.metrics.memory and heartbeat.metrics.memory.get("virtual", {}).get("percent", 0) > 95:
+        if heartbeat.metrics.cpu_percent > 95 or heartbeat.metrics.mem_percent > 95:
             suspicious_flag = True
         
         new_trust_score = calculate_agent_trust_score(
@@ -2593,24 +3029,30 @@ async def receive_agent_heartbeat(
             device.is_active = False
             logger.warning(f"Device {device.id} disabled due to low trust_score: {new_trust_score}")
         
+        # Read what the response needs before commit expires the device
+        device_id = device.id
+        is_approved = bool(device.is_approved)
+        requires_rotation = bool(device.agent_requires_rotation)
         db.commit()
-        db.refresh(device)
+        if new_trust_score < 20:
+            # The device list shows is_active; don't serve it as still active
+            _AGENT_DEVICES_CACHE.clear()
         
         logger.info(
             f"Agent heartbeat received: Device {device_uuid[:16]}... "
-            f"(ID: {device.id}) - Trust: {new_trust_score:.1f} - "
+            f"(ID: {device_id}) - Trust: {new_trust_score:.1f} - "
             f"CPU: {heartbeat.metrics.cpu.get('percent', 'N/A') if heartbeat.metrics.cpu else 'N/A'}%"
         )
         
-        return AgentHeartbeatResponse(
-            status="success",
-            message="Heartbeat received",
-            device_id=device.id,
-            new_trust_score=new_trust_score,
-            is_approved=bool(device.is_approved),
-            requires_rotation=bool(device.agent_requires_rotation),
-            received_at=now_ist()
-        )
+        return {
+            "status": "success",
+            "message": "Heartbeat received",
+            "device_id": device_id,
+            "new_trust_score": new_trust_score,
+            "is_approved": is_approved,
+            "requires_rotation": requires_rotation,
+            "received_at": now
+        }
         
     except HTTPException:
         raise
@@ -2623,6 +3065,26 @@ async def receive_agent_heartbeat(
         )
 
 
+# Device list pages keyed by (skip, limit). Heartbeats refresh last_seen_at and
+# trust_score every 30s anyway, so a page that old is as current as the agents
+# report; registrations, approvals and trust-score disables clear it
+# immediately.
+_AGENT_DEVICES_CACHE: dict[tuple, dict] = {}
+_AGENT_DEVICES_TTL_SECONDS = 30
+_AGENT_DEVICES_CACHE_MAX_ENTRIES = 256
+
+
+def _cache_agent_devices_page(key: tuple, data: dict, now: float) -> None:
+    # skip/limit come from the client, so expired pages are dropped on every
+    # write and the dict is capped rather than growing per distinct pair
+    for stale_key in [k for k, v in _AGENT_DEVICES_CACHE.items() if v["expires_at"] <= now]:
+        del _AGENT_DEVICES_CACHE[stale_key]
+    if len(_AGENT_DEVICES_CACHE) >= _AGENT_DEVICES_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order; drop the oldest entry
+        _AGENT_DEVICES_CACHE.pop(next(iter(_AGENT_DEVICES_CACHE)), None)
+    _AGENT_DEVICES_CACHE[key] = {"data": data, "expires_at": now + _AGENT_DEVICES_TTL_SECONDS}
+
+
 @app.get("/agent/devices", tags=["agent"])
 async def get_agent_devices(
     current_user: User = Depends(admin_required),
@@ -2634,12 +3096,14 @@ async def get_agent_devices(
     List all registered agent devices (admin only).
     """
     try:
-        statement = db.query(Device)
-        total = statement.count()
-        
-        devices = statement.offset(skip).limit(limit).all()
+        now = time.time()
+        cached = _AGENT_DEVICES_CACHE.get((skip, limit))
+        if cached and cached["expires_at"] > now:
+            return cached["data"]
+
+        devices, total = fetch_page(db.query(Device).order_by(Device.id), skip, limit)
         
-        return {
+        data = {
             "data": [
                 {
                     "id": d.id,
@@ -2661,6 +3125,8 @@ async def get_agent_devices(
                 "total_pages": (total + limit - 1) // limit
             }
         }
+        _cache_agent_devices_page((skip, limit), data, now)
+        return data
     except Exception as e:
         logger.error(f"Error fetching agent devices: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch devices")
@@ -2692,6 +3158,7 @@ async def approve_agent_device(
 
         audit_log = Log(
             user_id=current_user.id,
+            user_role=current_user.role,
             event_type="AGENT_APPROVED" if action == "approve" else "AGENT_REJECTED",
             action=f"Agent device {action}d",
             details=f"Device {device.device_uuid} {action}d by {current_user.username}. Reason: {request_data.reason or 'None'}",
@@ -2703,6 +3170,7 @@ async def approve_agent_device(
         )
         db.add(audit_log)
         db.commit()
+        _AGENT_DEVICES_CACHE.clear()
 
         return AgentApprovalResponse(
             device_id=device.id,
@@ -2720,6 +3188,13 @@ async def approve_agent_device(
         raise HTTPException(status_code=500, detail="Approval action failed")
 
 
+# Per-device telemetry row counts. Heartbeats append a row every 30s, so a total
+# a few seconds old is as good as exact; paging through history then runs just
+# the page query instead of counting the device's whole history each time.
+_TELEMETRY_COUNT_CACHE: dict[int, dict] = {}
+_TELEMETRY_COUNT_TTL_SECONDS = 10
+
+
 @app.get("/agent/devices/{device_id}/telemetry", tags=["agent"])
 async def get_device_telemetry(
     device_id: int,
@@ -2738,14 +3213,20 @@ async def get_device_telemetry(
             raise HTTPException(status_code=404, detail="Device not found")
         
         # Get telemetry snapshots
-        total = db.query(Telemetry).filter_by(device_id=device_id).count()
-        
-        telemetry_snapshots = db.query(Telemetry)\
-            .filter_by(device_id=device_id)\
-            .order_by(Telemetry.collected_at.desc())\
-            .offset(skip)\
-            .limit(limit)\
-            .all()
+        query = (
+            db.query(Telemetry.id, Telemetry.collected_at, Telemetry.metrics, Telemetry.sample_count)
+            .filter_by(device_id=device_id)
+            .order_by(Telemetry.collected_at.desc())
+        )
+        now = time.time()
+        cached = _TELEMETRY_COUNT_CACHE.get(device_id)
+        total_is_estimate = bool(cached and cached["expires_at"] > now)
+        if total_is_estimate:
+            telemetry_snapshots = query.offset(skip).limit(limit).all()
+            total = cached["data"]
+        else:
+            telemetry_snapshots, total = fetch_page(query, skip, limit)
+            _TELEMETRY_COUNT_CACHE[device_id] = {"data": total, "expires_at": now + _TELEMETRY_COUNT_TTL_SECONDS}
         
         return {
             "device_id": device_id,
@@ -2753,15 +3234,16 @@ async def get_device_telemetry(
             "hostname": device.hostname,
             "data": [
                 {
-                    "id": t.id,
-                    "collected_at": t.collected_at,
-                    "metrics": json.loads(t.metrics) if t.metrics else None,
-                    "sample_count": t.sample_count
+                    "id": t_id,
+                    "collected_at": collected_at,
+                    "metrics": metrics,
+                    "sample_count": sample_count
                 }
-                for t in telemetry_snapshots
+                for t_id, collected_at, metrics, sample_count in telemetry_snapshots
             ],
             "pagination": {
                 "total": total,
+                "total_is_estimate": total_is_estimate,
                 "skip": skip,
                 "limit": limit,
                 "total_pages": (total + limit - 1) // limit
@@ -2798,20 +3280,25 @@ async def get_admin_usb_events(
                     return None
             return None
 
+        # Only snapshots that actually carry USB events are loaded; the check
+        # runs in SQLite (JSON1) rather than decoding every heartbeat here.
+        # json_valid guards the CASE so a malformed row can't fail the query.
+        has_usb_events = case(
+            (func.json_valid(Telemetry.metrics), func.json_array_length(Telemetry.metrics, "$.usb_devices")),
+            else_=0
+        ) > 0
+
         snapshots = db.query(Telemetry, Device)\
             .join(Device, Device.id == Telemetry.device_id)\
+            .filter(has_usb_events)\
             .order_by(Telemetry.collected_at.desc())\
             .limit(2000)\
             .all()
 
         events = []
         for telemetry, device in snapshots:
-            if not telemetry.metrics:
-                continue
-
-            try:
-                metrics = json.loads(telemetry.metrics)
-            except Exception:
+            metrics = telemetry.metrics
+            if not isinstance(metrics, dict):
                 continue
 
             usb_devices = metrics.get("usb_devices")
@@ -2880,6 +3367,31 @@ async def get_admin_usb_events(
 
 
 # ---------------- Swagger Auth Support ----------------
+_OPENAPI_PROTECTED_PATHS = frozenset([
+    "/profile",
+    "/logs",
+    "/logs/search",
+    "/logs/enhanced",
+    "/sessions",
+    "/sessions/{session_id}",
+    "/admin/dashboard",
+    "/admin/profile",
+    "/admin/logs",
+    "/admin/logs/enhanced",
+    "/admin/logs/export",
+    "/admin/users",
+    "/admin/users/all",
+    "/admin/sessions",
+    "/admin/sessions/{session_id}",
+    "/users",
+    "/users/{user_id}",
+    "/admin/users/{user_id}/logs",
+    "/users/{user_id}/logs",
+    "/logout",
+])
+_OPENAPI_PROTECTED_METHODS = ("get", "post", "put", "delete")
+
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -2895,34 +3407,13 @@ def custom_openapi():
         "BearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}
     }
 
-    protected_endpoints = [
-        "/profile",
-        "/logs",
-        "/logs/search",
-        "/logs/enhanced",
-        "/sessions",
-        "/sessions/{session_id}",
-        "/admin/dashboard",
-        "/admin/profile",
-        "/admin/logs",
-        "/admin/logs/enhanced",
-        "/admin/logs/export",
-        "/admin/users",
-        "/admin/users/all",
-        "/admin/sessions",
-        "/admin/sessions/{session_id}",
-        "/users",
-        "/users/{user_id}",
-        "/admin/users/{user_id}/logs",
-        "/users/{user_id}/logs",
-        "/logout",
-    ]
-    
-    for path in protected_endpoints:
-        if path in schema["paths"]:
-            for method in ["get", "post", "put", "delete"]:
-                if method in schema["paths"][path]:
-                    schema["paths"][path][method]["security"] = [{"BearerAuth": []}]
+    # One pass over the generated paths with a set lookup per path
+    for path, operations in schema["paths"].items():
+        if path in _OPENAPI_PROTECTED_PATHS:
+            for method in _OPENAPI_PROTECTED_METHODS:
+                operation = operations.get(method)
+                if operation is not None:
+                    operation["security"] = [{"BearerAuth": []}]
 
     app.openapi_schema = schema
     return app.openapi_schema
@@ -2932,5 +3423,8 @@ app.openapi = custom_openapi
 
 if __name__ == "__main__":
     import uvicorn
-    # Start on localhost:8000 for Google OAuth compatibility
-    uvicorn.run(app, host="localhost", port=8000)
+    # Start on localhost:8000 for Google OAuth compatibility. With
+    # uvicorn[standard] installed, the default "auto" loop/http settings run on
+    # uvloop + httptools (asyncio + h11 where uvloop isn't available, e.g.
+    # Windows). One process: rate limits, caches and write buffers are in-memory.
+    uvicorn.run(app, host="localhost", port=8000, loop="auto", http="auto")
@@ -1,9 +1,12 @@
 from datetime import timedelta
 from time_utils import now_ist
-from jose import JWTError, jwt
+from jose import JWTError, jwt, jwk
 import bcrypt
 from dotenv import load_dotenv
+import hashlib
+import hmac
 import os
+import time
 
 # Load environment variables
 load_dotenv()
@@ -12,9 +15,18 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your_super_secret_key_change_this_in_production_12345!@#$%")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+# HMAC key object built once. Passing a jose Key to jwt.encode/decode skips
+# jose's per-call key handling (a json.loads attempt on the secret, then
+# jwk.construct) on every token.
+JWT_KEY = jwk.construct(SECRET_KEY, ALGORITHM)
+
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 120))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
+# bcrypt hash of a random throwaway secret. Verified against when the login
+# identifier matches no user, so unknown accounts cost the same as real ones.
+DUMMY_PASSWORD_HASH = "$2b$12$aCerdJEK5TxF39lm7dGASOEbi7PWDdkcr5zhLWnPvqigVQN4oYMGe"
+
 # ---------------- HASH PASSWORD ----------------
 def hash_password(password: str):
     # bcrypt has 72 byte input limit → truncate to avoid crash
@@ -29,6 +41,43 @@ def verify_password(plain_password: str, hashed_password: str):
     hashed_bytes = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password_bytes, hashed_bytes)
 
+# ---------------- VERIFIED PASSWORD CACHE (opt-in) ----------------
+# Successful bcrypt checks, remembered for PASSWORD_VERIFY_CACHE_SECONDS so a
+# user logging in again shortly afterwards skips the hash. Off by default
+# (0). Entries are {"data": True, "expires_at": epoch}, keyed by an HMAC of
+# the stored hash and the password under a per-process random key: no
+# plaintext is kept, and a password change (new hash) misses the cache.
+# Failed checks are never cached.
+PASSWORD_VERIFY_CACHE_SECONDS = int(os.getenv("PASSWORD_VERIFY_CACHE_SECONDS", 0))
+_VERIFIED_PASSWORD_CACHE: dict = {}
+_VERIFIED_PASSWORD_CACHE_MAX_ENTRIES = 10_000
+_VERIFIED_PASSWORD_KEY = os.urandom(32)
+
+
+def verify_password_cached(plain_password: str, hashed_password: str) -> bool:
+    """verify_password, answered from the verified-password cache when enabled"""
+    if PASSWORD_VERIFY_CACHE_SECONDS <= 0:
+        return verify_password(plain_password, hashed_password)
+
+    key = hmac.new(
+        _VERIFIED_PASSWORD_KEY,
+        f"{hashed_password}\0{plain_password}".encode("utf-8"),
+        hashlib.sha256
+    ).digest()
+    now = time.time()
+    cached = _VERIFIED_PASSWORD_CACHE.get(key)
+    if cached and cached["expires_at"] > now:
+        return True
+
+    if not verify_password(plain_password, hashed_password):
+        return False
+
+    if len(_VERIFIED_PASSWORD_CACHE) >= _VERIFIED_PASSWORD_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order; drop the oldest entry
+        _VERIFIED_PASSWORD_CACHE.pop(next(iter(_VERIFIED_PASSWORD_CACHE)), None)
+    _VERIFIED_PASSWORD_CACHE[key] = {"data": True, "expires_at": now + PASSWORD_VERIFY_CACHE_SECONDS}
+    return True
+
 # ---------------- ACCESS TOKEN (short-lived) ----------------
 # Payload structure for device-bound sessions:
 # {
@@ -54,11 +103,11 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = now_ist() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, JWT_KEY, algorithm=ALGORITHM)
 
 # ---------------- REFRESH TOKEN (long-lived) ----------------
 def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = now_ist() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, JWT_KEY, algorithm=ALGORITHM)
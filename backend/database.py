@@ -1,5 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+import orjson
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -7,8 +8,28 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # SQLite database (file will be created automatically)
 DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'insider.db')}"
 
+
+def _json_serializer(value) -> str:
+    """orjson encoding for JSON columns (datetimes go through str, as before)"""
+    return orjson.dumps(value, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+
+# Connection pool sized for concurrent requests on the worker threadpool
+# (app.THREADPOOL_SIZE defaults to DB_POOL_SIZE + DB_MAX_OVERFLOW, one
+# connection per thread); pre-ping discards connections that went stale
+# between requests
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -1,18 +1,57 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
-from auth import SECRET_KEY, ALGORITHM
+from auth import JWT_KEY, ALGORITHM
 from time_utils import now_ist, ensure_ist
 from database import SessionLocal
 from sqlalchemy.orm import Session
 import models
+import hashlib
+import time
 
 # Use HTTP Bearer Token — NOT OAuth2
 security = HTTPBearer()  
 
+# Verified JWT payloads keyed by SHA-256 of the token:
+# {"data": payload, "expires_at": epoch}. Clients resend the same token on
+# every request, so this skips the signature check and claim parsing on
+# repeats. Only the decode is cached; session and device state are still
+# read from the DB on every request, so revocation takes effect immediately.
+_TOKEN_PAYLOAD_CACHE: dict = {}
+_TOKEN_PAYLOAD_TTL_SECONDS = 10
+_TOKEN_PAYLOAD_CACHE_MAX_ENTRIES = 10_000
+
+
+def _decode_token(token: str) -> dict:
+    """jwt.decode with a short-lived cache of successful results"""
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    cached = _TOKEN_PAYLOAD_CACHE.get(key)
+    if cached and cached["expires_at"] > now:
+        return cached["data"]
+
+    payload = jwt.decode(token, JWT_KEY, algorithms=[ALGORITHM])
+
+    # Never serve a payload past the token's own expiry
+    expires_at = now + _TOKEN_PAYLOAD_TTL_SECONDS
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        expires_at = min(expires_at, exp)
+
+    if len(_TOKEN_PAYLOAD_CACHE) >= _TOKEN_PAYLOAD_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order; drop the oldest entry
+        _TOKEN_PAYLOAD_CACHE.pop(next(iter(_TOKEN_PAYLOAD_CACHE)), None)
+    _TOKEN_PAYLOAD_CACHE[key] = {"data": payload, "expires_at": expires_at}
+    return payload
+
 
 def get_db():
-    """Database session dependency"""
+    """
+    Database session dependency.
+
+    Routes and the auth dependencies below all depend on this one function, so
+    FastAPI's per-request dependency cache gives them a single shared session.
+    """
     db = SessionLocal()
     try:
         yield db
@@ -27,13 +66,13 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     Extract and validate JWT token with full zero-trust enforcement.
     
     Optimized Validation Pipeline:
-    1. Decode JWT and extract user_id, device_id, session_id
+    1. Decode JWT (cached briefly per token) and extract user_id, device_id, session_id
     2. Query session (with user_id filter for DB-level validation)
     3. Verify session is active
     4. Check device-session binding (before device query - fail fast)
     5. Query device (with user_id + device_id filters for atomic validation)
     6. Verify device is active and trusted
-    7. Query user (only used for return value)
+    7. Return the user (loaded together with the session in step 2)
     
     This provides:
     ✓ Token validation (JWT signature)
@@ -54,7 +93,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
 
     try:
         # Decode JWT payload
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         user_id_str = payload.get("sub")
         device_id = payload.get("device_id")
         session_id = payload.get("session_id")
@@ -78,13 +117,18 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         # SESSION VALIDATION (Stateful session enforcement - Query with filters)
         # =====================================================================
         # Query session with user_id included in filter for DB-level atomic validation
-        # This prevents session-user mismatch at the database level
+        # This prevents session-user mismatch at the database level.
+        # The user row is joined in, so no separate user query is needed later.
         
-        session = db.query(models.Session).filter(
+        row = db.query(models.Session, models.User).join(
+            models.User, models.User.id == models.Session.user_id
+        ).filter(
             models.Session.session_id == session_id,
             models.Session.user_id == user_id
         ).first()
 
+        session, user = row if row else (None, None)
+
         if session is None:
             raise HTTPException(
                 status_code=401,
@@ -178,17 +222,6 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
                     detail="Device trust score is too low"
                 )
 
-        # =====================================================================
-        # USER RETRIEVAL (Final step - only needed to return user object)
-        # =====================================================================
-        # Query user to return authenticated user object
-        # Session validation already confirms user exists
-        
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-
-        if user is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-
         # All validations passed - return authenticated user
         return user
 
@@ -199,6 +232,23 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise
 
 
+# Agent heartbeat token: parsed by HTTPBearer, but a missing header is a 401
+# (HTTPBearer's own error is a 403) like every other agent auth failure
+agent_security = HTTPBearer(auto_error=False)
+
+
+def get_agent_token(credentials: HTTPAuthorizationCredentials = Depends(agent_security)) -> str:
+    """Raw agent token from the Authorization: Bearer header"""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+
+    # Agent tokens are 128-char hex; reject anything else before a DB lookup
+    if len(credentials.credentials) != 128:
+        raise HTTPException(status_code=401, detail="Invalid token format")
+
+    return credentials.credentials
+
+
 # Admin access guard
 def admin_required(current_user: models.User = Depends(get_current_user)):
     """Verify user is admin"""
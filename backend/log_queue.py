@@ -0,0 +1,162 @@
+"""
+Buffered Log & Telemetry Ingestion
+
+Append-only rows submitted by agents (activity logs, heartbeat telemetry) are
+queued in memory and written by a background task in batches:
+- One multi-row INSERT + commit per batch instead of one per request
+- Batches flush at BATCH_SIZE rows or every FLUSH_INTERVAL_SECONDS
+- Bounded queue: producers wait when the writer falls behind
+- A failed batch is retried, then written row by row so a bad row only
+  loses itself
+
+Rows still queued at shutdown are flushed before the process exits.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Log, Telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class InsertBuffer:
+    """
+    In-process queue of pending rows for one table with a background flusher.
+
+    Rows are plain dicts of column values; they are inserted with a single
+    Core executemany per batch, skipping ORM unit-of-work overhead.
+    """
+
+    def __init__(self, model):
+        # Configuration
+        self.MAX_QUEUE_SIZE = 50_000
+        self.BATCH_SIZE = 5000
+        self.FLUSH_INTERVAL_SECONDS = 1.0
+        self.BATCH_ATTEMPTS = 3
+        self.RETRY_DELAY_SECONDS = 0.5
+
+        self.model = model
+        # Created in start() so they belong to the serving event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._has_rows: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Rows taken off the queue but not yet handed to the writer
+        self._pending: list = []
+
+    async def put(self, row: dict) -> None:
+        """Queue a row for the next batch (written directly if the flusher isn't running)"""
+        if self._task is None:
+            await run_in_threadpool(self._write_batch, [row])
+            return
+        await self._queue.put(row)
+        self._has_rows.set()
+
+    def start(self) -> None:
+        """Start the background flusher (call from the app's startup event)"""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.MAX_QUEUE_SIZE)
+            self._has_rows = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out anything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        remaining, self._pending = self._pending, []
+        while self._queue is not None and not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            await run_in_threadpool(self._write_batch, remaining)
+
+    async def _fill_pending(self) -> None:
+        """Wait for one row, then collect more until the batch is full or the interval ends"""
+        self._pending.append(await self._queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.FLUSH_INTERVAL_SECONDS
+
+        # Rows are only taken with get_nowait(); the timed wait is on the
+        # _has_rows event, so a timeout can never discard a dequeued row
+        # (asyncio.wait_for around queue.get() can before Python 3.12)
+        while len(self._pending) < self.BATCH_SIZE:
+            try:
+                self._pending.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            # No await between the empty check and clear(), so a put() can't
+            # slip in unnoticed
+            self._has_rows.clear()
+            try:
+                await asyncio.wait_for(self._has_rows.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self) -> None:
+        while True:
+            await self._fill_pending()
+            batch, self._pending = self._pending, []
+            await run_in_threadpool(self._write_batch, batch)
+
+    def _write_batch(self, rows: list) -> None:
+        """Write rows in one transaction, retrying, then row by row as a last resort"""
+        # executemany needs every row to bind the same columns, and producers
+        # may fill different optional ones; group by column set
+        groups: dict = {}
+        for row in rows:
+            groups.setdefault(frozenset(row), []).append(row)
+
+        for attempt in range(1, self.BATCH_ATTEMPTS + 1):
+            db = SessionLocal()
+            try:
+                for group in groups.values():
+                    db.execute(insert(self.model), group)
+                db.commit()
+                return
+            except Exception as e:
+                db.rollback()
+                logger.warning(
+                    f"Writing {len(rows)} buffered {self.model.__tablename__} rows failed "
+                    f"(attempt {attempt}/{self.BATCH_ATTEMPTS}): {e}"
+                )
+            finally:
+                db.close()
+            if attempt < self.BATCH_ATTEMPTS:
+                time.sleep(self.RETRY_DELAY_SECONDS)
+
+        self._write_rows_individually(rows)
+
+    def _write_rows_individually(self, rows: list) -> None:
+        """One commit per row, so a row that can't be written doesn't take the batch with it"""
+        db = SessionLocal()
+        try:
+            for row in rows:
+                try:
+                    db.execute(insert(self.model), [row])
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Dropped buffered {self.model.__tablename__} row {row!r}: {e}")
+        finally:
+            db.close()
+
+
+# Global buffer instances
+log_buffer = InsertBuffer(Log)
+telemetry_buffer = InsertBuffer(Telemetry)
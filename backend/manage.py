@@ -0,0 +1,45 @@
+"""
+Backend Management Commands
+===========================
+
+Usage:
+    python manage.py migrate           # create tables / apply schema patches and
+                                       # missing models.py indexes if out of date
+    python manage.py migrate --force   # run them even if the database looks current
+
+Run `migrate` once per deploy before starting the server; the server can then
+be started with RUN_MIGRATIONS_ON_BOOT=0 so no worker touches the schema.
+"""
+
+import argparse
+import sys
+
+from schema_setup import ensure_db_schema
+
+
+def migrate(force: bool = False) -> int:
+    print("=" * 60)
+    print("Schema Migration")
+    print("=" * 60)
+    if ensure_db_schema(force=force):
+        print("\n✅ Database schema is up to date.\n")
+        return 0
+    print("\n❌ Schema setup did not complete; see the warnings above.\n")
+    return 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Zero Trust backend management")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subcommands.add_parser("migrate", help="Create tables and apply schema patches")
+    migrate_parser.add_argument("--force", action="store_true", help="Run even if the schema version matches")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        return migrate(force=args.force)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,11 +28,16 @@ def _load_env() -> list[str]:
     if found_env:
         candidates.append(Path(found_env))
 
+    # find_dotenv usually returns env_path itself; parse each distinct file once
     loaded_paths = []
+    seen: set[Path] = set()
     for candidate in candidates:
-        if candidate and Path(candidate).exists():
-            load_dotenv(dotenv_path=candidate, override=True)
-            loaded_paths.append(str(candidate))
+        resolved = candidate.resolve()
+        if resolved in seen or not resolved.is_file():
+            continue
+        seen.add(resolved)
+        load_dotenv(dotenv_path=resolved, override=True)
+        loaded_paths.append(str(candidate))
     return loaded_paths
 
 
@@ -46,17 +51,16 @@ _JWKS_CACHE: dict[str, dict] = {}
 _CACHE_TTL_SECONDS = 3600
 
 
-def _load_env_vars() -> tuple[str | None, str, list[str]]:
-    loaded_paths = _load_env()
-    client_id = os.getenv("MICROSOFT_CLIENT_ID")
-    tenant_id = os.getenv("MICROSOFT_TENANT_ID", "common")
-    logger.debug(
-        "Loaded Microsoft env vars client_id=%s tenant_id=%s paths=%s",
-        bool(client_id),
-        tenant_id,
-        loaded_paths or _ENV_PATHS
-    )
-    return client_id, tenant_id, (loaded_paths or _ENV_PATHS)
+# Read once at import, after the .env files above are loaded; changing them
+# takes a restart instead of re-reading .env on every token verification
+MICROSOFT_CLIENT_ID = os.getenv("MICROSOFT_CLIENT_ID")
+MICROSOFT_TENANT_ID = os.getenv("MICROSOFT_TENANT_ID", "common")
+logger.debug(
+    "Loaded Microsoft env vars client_id=%s tenant_id=%s paths=%s",
+    bool(MICROSOFT_CLIENT_ID),
+    MICROSOFT_TENANT_ID,
+    _ENV_PATHS
+)
 
 
 def _fetch_json(url: str) -> dict:
@@ -126,10 +130,10 @@ def _get_expected_issuer(tenant_id: str) -> str:
 
 
 async def verify_microsoft_token(token: str) -> dict:
-    microsoft_client_id, microsoft_tenant_id, env_paths = _load_env_vars()
+    microsoft_client_id, microsoft_tenant_id = MICROSOFT_CLIENT_ID, MICROSOFT_TENANT_ID
 
     if not microsoft_client_id:
-        paths_info = ", ".join(env_paths) if env_paths else "(no .env found)"
+        paths_info = ", ".join(_ENV_PATHS) if _ENV_PATHS else "(no .env found)"
         raise ValueError(
             "MICROSOFT_CLIENT_ID not configured. "
             f"Checked: {paths_info}. Module: {__file__}"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float, Index, JSON
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -14,7 +14,7 @@ class User(Base):
     company_email = Column(String, unique=True, index=True, nullable=True)
     personal_email = Column(String, unique=True, index=True, nullable=True)
     password_hash = Column(String, nullable=True)
-    role = Column(String, default="user", nullable=False)  # user, admin, superadmin
+    role = Column(String, default="user", nullable=False, index=True)  # user, admin, superadmin
 
     # Auth provider fields
     auth_provider = Column(String, default="local", nullable=False, index=True)
@@ -51,7 +51,7 @@ class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, unique=True, index=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    session_id = Column(String, unique=True, index=True, nullable=False, default=lambda: uuid.uuid4().hex)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     device_id = Column(Integer, ForeignKey("devices.id"), nullable=True, index=True)  # Link to device
     
@@ -79,6 +79,13 @@ class Session(Base):
     login_at = Column(DateTime(timezone=True), default=now_ist, nullable=False, index=True)
     logout_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False, index=True)
+
+    __table_args__ = (
+        # Active-session lookups per user (logout, lock cascade, session counts)
+        Index("ix_sessions_user_active_device", "user_id", "is_active", "device"),
+        # Newest-first session listings for one user (history, admin filters)
+        Index("ix_sessions_user_login", "user_id", "login_at"),
+    )
     
     def __repr__(self):
         return f"<Session(id={self.id}, user_id={self.user_id}, ip={self.ip_address}, active={self.is_active})>"
@@ -90,6 +97,9 @@ class Log(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    # Denormalized users.role so admin listings can filter without joining users;
+    # writers pass the role they already know
+    user_role = Column(String, nullable=True)
     
     # Event classification
     event_type = Column(String, nullable=False, index=True)  # LOGIN_SUCCESS, LOGIN_FAILED, LOGOUT, etc.
@@ -115,6 +125,14 @@ class Log(Base):
     # Legacy field for backward compatibility
     time = Column(DateTime(timezone=True), default=now_ist, nullable=False, index=True)
     ip = Column(String, nullable=True)  # Legacy field
+
+    __table_args__ = (
+        # Newest-first log listings filtered by user, event type or status
+        Index("ix_logs_user_timestamp", "user_id", "timestamp"),
+        Index("ix_logs_event_type_timestamp", "event_type", "timestamp"),
+        Index("ix_logs_status_timestamp", "status", "timestamp"),
+        Index("ix_logs_user_role_timestamp", "user_role", "timestamp"),
+    )
     
     def __repr__(self):
         return f"<Log(id={self.id}, user_id={self.user_id}, event_type={self.event_type}, timestamp={self.timestamp})>"
@@ -201,8 +219,9 @@ class Telemetry(Base):
     # Timestamp of collection
     collected_at = Column(DateTime(timezone=True), default=now_ist, nullable=False, index=True)
     
-    # System metrics (stored as serialized JSON for flexibility)
-    metrics = Column(Text, nullable=True)  # JSON: {cpu, memory, disk, processes, network, users, usb_devices}
+    # System metrics. Stored as JSON text (same layout as before), but encoded
+    # and decoded by the engine, and queryable with SQLite's JSON1 functions.
+    metrics = Column(JSON(none_as_null=True), nullable=True)  # {cpu, memory, disk, processes, network, users, usb_devices}
     
     # Data quality
     sample_count = Column(Integer, default=1, nullable=False)  # For aggregated data
@@ -3,7 +3,7 @@ PHASE B: Rate Limiting Middleware
 
 Sliding window rate limiting for:
 - IP-based limits (10 req/min per IP)
-- Token-based limits (50 heartbeats/min per token)
+- Token-based limits (6 heartbeats/min per token)
 - Endpoint-specific limits
 
 Thread-safe using in-memory dictionary with cleanup.
@@ -32,7 +32,7 @@ class RateLimiter:
         
         # Configuration
         self.IP_LIMIT_PER_MINUTE = 10      # 10 requests per minute per IP
-        self.TOKEN_LIMIT_PER_MINUTE = 50   # 50 heartbeats per minute per token
+        self.TOKEN_LIMIT_PER_MINUTE = 6    # 2/min heartbeat baseline + 4 burst per token
         self.WINDOW_SIZE_SECONDS = 60      # Sliding window = 1 minute
         
     def _get_window_key(self, key_type: str, key_value: str) -> str:
@@ -0,0 +1,138 @@
+"""
+Database Schema Setup
+
+Brings the SQLite database up to the schema declared in models.py:
+- create_all for missing tables
+- Declared indexes missing from existing tables
+- Compatibility patches for columns/indexes added after a database was created
+- A schema fingerprint in PRAGMA user_version so current databases are skipped
+
+Run at deploy time with `python manage.py migrate`; app.py also calls
+ensure_db_schema() on import unless RUN_MIGRATIONS_ON_BOOT=0.
+"""
+
+import hashlib
+import logging
+
+from sqlalchemy import text
+
+from database import Base, engine
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+
+def _ensure_sqlite_oauth_schema() -> bool:
+    """Best-effort SQLite compatibility patch for existing dev databases."""
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(text("PRAGMA table_info(users)"))
+            columns = {row[1] for row in result.fetchall()}
+
+            if "auth_provider" not in columns:
+                conn.execute(
+                    text("ALTER TABLE users ADD COLUMN auth_provider VARCHAR NOT NULL DEFAULT 'local'")
+                )
+                logger.warning("Added missing users.auth_provider column")
+
+            if "microsoft_id" not in columns:
+                conn.execute(text("ALTER TABLE users ADD COLUMN microsoft_id VARCHAR"))
+                logger.warning("Added missing users.microsoft_id column")
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_auth_provider ON users (auth_provider)"))
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_microsoft_id ON users (microsoft_id)"))
+        return True
+    except Exception as exc:
+        logger.warning("SQLite schema compatibility check skipped: %s", str(exc))
+        return False
+
+
+def _ensure_sqlite_log_schema() -> bool:
+    """Add and backfill logs.user_role on databases created before the column existed."""
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(text("PRAGMA table_info(logs)"))
+            columns = {row[1] for row in result.fetchall()}
+
+            if "user_role" not in columns:
+                conn.execute(text("ALTER TABLE logs ADD COLUMN user_role VARCHAR"))
+                conn.execute(text(
+                    "UPDATE logs SET user_role = (SELECT role FROM users WHERE users.id = logs.user_id)"
+                ))
+                logger.warning("Added and backfilled missing logs.user_role column")
+
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_logs_user_role_timestamp ON logs (user_role, timestamp)"
+            ))
+        return True
+    except Exception as exc:
+        logger.warning("SQLite log schema check skipped: %s", str(exc))
+        return False
+
+
+def _ensure_declared_indexes() -> bool:
+    """Create any index declared in models.py that the database doesn't have yet."""
+    # create_all skips tables that already exist, indexes included, so
+    # indexes added to the models later have to be created one by one
+    try:
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+        return True
+    except Exception as exc:
+        logger.warning("Index setup skipped: %s", str(exc))
+        return False
+
+
+# Bump when the compatibility patches above change, so existing databases
+# get them applied on the next start (2: declared indexes are created)
+_SCHEMA_PATCH_REVISION = 2
+
+
+def _schema_fingerprint() -> int:
+    """31-bit hash of the model tables, columns and indexes plus the patch revision"""
+    parts = [str(_SCHEMA_PATCH_REVISION)]
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}" for column in table.columns)
+        parts.extend(sorted(index.name or "" for index in table.indexes))
+    digest = hashlib.sha1("|".join(parts).encode()).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+def ensure_db_schema(force: bool = False) -> bool:
+    """
+    Create tables and apply the compatibility patches, unless this database
+    was already brought up to the current schema.
+
+    The schema fingerprint is kept in SQLite's PRAGMA user_version, in the
+    database file itself, so a restart (or every worker of a multi-worker
+    server) costs one PRAGMA read instead of create_all's table probes and
+    the patch statements. A new or replaced database file starts at 0.
+
+    force skips the version check and always runs the setup. Returns True
+    if the schema is current afterwards.
+    """
+    fingerprint = _schema_fingerprint()
+    if not force:
+        try:
+            with engine.connect() as conn:
+                if conn.execute(text("PRAGMA user_version")).scalar() == fingerprint:
+                    return True
+        except Exception as exc:
+            logger.warning("Schema version check failed: %s", str(exc))
+
+    # Create DB tables
+    Base.metadata.create_all(bind=engine)
+    patched = _ensure_sqlite_oauth_schema()
+    patched = _ensure_sqlite_log_schema() and patched
+    # After the column patches, so indexes on patched columns can be built
+    patched = _ensure_declared_indexes() and patched
+
+    # Only record the version once every patch went through, so a failed
+    # one is retried on the next start
+    if patched:
+        with engine.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {fingerprint}"))
+    return patched
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator, model_validator
 from datetime import datetime
 from typing import Optional, Any
 import json
+import re
 
 class UserCreate(BaseModel):
     username: str
@@ -37,8 +38,7 @@ class UserResponse(BaseModel):
     status: Optional[str] = "active"
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # =============================================================================
 # PHASE 1: Session Schemas
@@ -59,8 +59,7 @@ class SessionResponse(BaseModel):
     logout_at: Optional[datetime]
     is_active: bool
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class EnhancedSessionResponse(BaseModel):
@@ -85,8 +84,7 @@ class EnhancedSessionResponse(BaseModel):
     logout_at: Optional[datetime]
     is_active: bool
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SessionSummary(BaseModel):
     """Simplified session info for user display"""
@@ -108,16 +106,15 @@ class LogCreate(BaseModel):
     ip: str
     device: str
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "username": "john_doe",
-                "action": "file_access",
-                "details": "Accessed /etc/passwd",
-                "ip": "192.168.1.100",
-                "device": "LAPTOP-XYZ"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "username": "john_doe",
+            "action": "file_access",
+            "details": "Accessed /etc/passwd",
+            "ip": "192.168.1.100",
+            "device": "LAPTOP-XYZ"
         }
+    })
 
 class LogResponse(BaseModel):
     id: int
@@ -128,8 +125,7 @@ class LogResponse(BaseModel):
     device: str
     time: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # =============================================================================
 # PHASE 1: Enhanced Log Schemas
@@ -151,8 +147,7 @@ class EnhancedLogResponse(BaseModel):
     status: str
     timestamp: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # =============================================================================
 # PHASE 3: Admin Monitoring Responses
@@ -176,11 +171,13 @@ class AdminUserLogsResponse(BaseModel):
     username: str
     role: str
     data: list[EnhancedLogResponse]
-    pagination: Pagination
+    pagination: Optional[Pagination] = None  # Omitted for cursor requests
+    next_cursor: Optional[str] = None
 
 class AdminSessionsResponse(BaseModel):
     data: list[SessionResponse]
-    pagination: Pagination
+    pagination: Optional[Pagination] = None  # Omitted for cursor requests
+    next_cursor: Optional[str] = None
 
 
 class LoginHistoryResponse(BaseModel):
@@ -236,8 +233,7 @@ class LockUnlockRequestResponse(BaseModel):
     requested_by_username: Optional[str] = None
     reviewed_by_username: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ReviewRequestAction(BaseModel):
     """Superadmin review action"""
@@ -254,20 +250,30 @@ class PendingRequestsResponse(BaseModel):
 # Device Registration Schemas
 # =============================================================================
 
+_DEVICE_UUID_RE = re.compile(r"^[A-Za-z0-9_-]{32,128}$")
+
+
 class DeviceRegister(BaseModel):
     """Request schema for device registration"""
     device_uuid: str
     device_name: str
     os: Optional[str] = None
+
+    @field_validator("device_uuid")
+    @classmethod
+    def _check_device_uuid(cls, value: str) -> str:
+        # 32-128 URL-safe characters (the web client sends a 64-char hex hash)
+        if not _DEVICE_UUID_RE.match(value):
+            raise ValueError("Device UUID must be 32-128 letters, digits, '-' or '_'")
+        return value
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "device_uuid": "a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6",
-                "device_name": "iPhone 15 Pro - Safari",
-                "os": "iOS 17.3"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "device_uuid": "a1b2c3d4e5f6g7h8i9j0k1l2m3n4o5p6",
+            "device_name": "iPhone 15 Pro - Safari",
+            "os": "iOS 17.3"
         }
+    })
 
 class DeviceResponse(BaseModel):
     """Response schema for device registration"""
@@ -280,8 +286,7 @@ class DeviceResponse(BaseModel):
     first_registered_at: datetime
     last_seen_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # =============================================================================
@@ -294,14 +299,13 @@ class AgentSystemInfo(BaseModel):
     cpu_model: Optional[str] = None
     total_memory_gb: Optional[float] = None
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "mac_address": "00:11:22:33:44:55",
-                "cpu_model": "Intel Core i7-10700K",
-                "total_memory_gb": 16.0
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "mac_address": "00:11:22:33:44:55",
+            "cpu_model": "Intel Core i7-10700K",
+            "total_memory_gb": 16.0
         }
+    })
 
 
 class AgentRegisterRequest(BaseModel):
@@ -311,19 +315,18 @@ class AgentRegisterRequest(BaseModel):
     os_version: str
     system_info: Optional[AgentSystemInfo] = None
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
-                "hostname": "JOHN-PC",
-                "os_version": "Windows 10 (Build 19045)",
-                "system_info": {
-                    "mac_address": "00:11:22:33:44:55",
-                    "cpu_model": "Intel Core i7-10700K",
-                    "total_memory_gb": 16.0
-                }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
+            "hostname": "JOHN-PC",
+            "os_version": "Windows 10 (Build 19045)",
+            "system_info": {
+                "mac_address": "00:11:22:33:44:55",
+                "cpu_model": "Intel Core i7-10700K",
+                "total_memory_gb": 16.0
             }
         }
+    })
 
 
 class AgentRegisterResponse(BaseModel):
@@ -335,17 +338,16 @@ class AgentRegisterResponse(BaseModel):
     heartbeat_interval: int = 30
     message: str = "Device registered. Awaiting admin approval."
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "agent_token": "a7f3c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a3f5c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1",
-                "device_id": 42,
-                "registered_at": "2024-01-15T10:30:45.123456+00:00",
-                "is_approved": False,
-                "heartbeat_interval": 30,
-                "message": "Device registered. Awaiting admin approval."
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "agent_token": "a7f3c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a3f5c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1",
+            "device_id": 42,
+            "registered_at": "2024-01-15T10:30:45.123456+00:00",
+            "is_approved": False,
+            "heartbeat_interval": 30,
+            "message": "Device registered. Awaiting admin approval."
         }
+    })
 
 
 class TelemetryMetrics(BaseModel):
@@ -357,19 +359,33 @@ class TelemetryMetrics(BaseModel):
     network: Optional[dict[str, Any]] = None
     logged_in_users: Optional[list[dict[str, Any]]] = None
     usb_devices: Optional[list[dict[str, Any]]] = None
+
+    # cpu.percent and memory.virtual.percent pulled out once at validation for
+    # the heartbeat anomaly check; excluded from the stored snapshot
+    cpu_percent: float = Field(0.0, exclude=True)
+    mem_percent: float = Field(0.0, exclude=True)
+
+    @model_validator(mode="after")
+    def _extract_usage_percents(self):
+        def percent(section):
+            value = section.get("percent") if isinstance(section, dict) else None
+            return float(value) if isinstance(value, (int, float)) else 0.0
+
+        self.cpu_percent = percent(self.cpu)
+        self.mem_percent = percent((self.memory or {}).get("virtual"))
+        return self
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "cpu": {"percent": 25.5, "per_cpu": [20, 30, 25, 26]},
-                "memory": {"virtual": {"used_mb": 8192, "percent": 50}},
-                "disk": {"disks": [{"device": "C:", "used_gb": 250}]},
-                "processes": {"total": 150, "running": 145},
-                "network": {"connections": {"ESTABLISHED": 25}},
-                "logged_in_users": [{"name": "john", "terminal": "pts/0"}],
-                "usb_devices": [{"name": "Kingston DataTraveler"}]
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "cpu": {"percent": 25.5, "per_cpu": [20, 30, 25, 26]},
+            "memory": {"virtual": {"used_mb": 8192, "percent": 50}},
+            "disk": {"disks": [{"device": "C:", "used_gb": 250}]},
+            "processes": {"total": 150, "running": 145},
+            "network": {"connections": {"ESTABLISHED": 25}},
+            "logged_in_users": [{"name": "john", "terminal": "pts/0"}],
+            "usb_devices": [{"name": "Kingston DataTraveler"}]
         }
+    })
 
 
 class AgentHeartbeatRequest(BaseModel):
@@ -379,18 +395,17 @@ class AgentHeartbeatRequest(BaseModel):
     timestamp: Optional[datetime] = None
     nonce: Optional[str] = None  # PHASE B: 16-byte random hex for replay protection
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
-                "metrics": {
-                    "cpu": {"percent": 25.5},
-                    "memory": {"virtual": {"percent": 50.0}}
-                },
-                "timestamp": "2024-01-15T10:30:45.123456+00:00",
-                "nonce": "a7f3c9e2b1d4f6a8"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
+            "metrics": {
+                "cpu": {"percent": 25.5},
+                "memory": {"virtual": {"percent": 50.0}}
+            },
+            "timestamp": "2024-01-15T10:30:45.123456+00:00",
+            "nonce": "a7f3c9e2b1d4f6a8"
         }
+    })
 
 
 class AgentHeartbeatResponse(BaseModel):
@@ -403,18 +418,17 @@ class AgentHeartbeatResponse(BaseModel):
     requires_rotation: bool = False  # PHASE B: Force token rotation if True
     received_at: datetime
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "status": "success",
-                "message": "Heartbeat received",
-                "device_id": 42,
-                "new_trust_score": 95.0,
-                "is_approved": True,
-                "requires_rotation": False,
-                "received_at": "2024-01-15T10:30:45.123456+00:00"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "status": "success",
+            "message": "Heartbeat received",
+            "device_id": 42,
+            "new_trust_score": 95.0,
+            "is_approved": True,
+            "requires_rotation": False,
+            "received_at": "2024-01-15T10:30:45.123456+00:00"
         }
+    })
 
 
 class TelemetryResponse(BaseModel):
@@ -424,8 +438,7 @@ class TelemetryResponse(BaseModel):
     collected_at: datetime
     metrics: Optional[dict] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # =============================================================================
 # PHASE B: TOKEN ROTATION & DEVICE APPROVAL SCHEMAS
@@ -436,13 +449,12 @@ class AgentTokenRotateRequest(BaseModel):
     device_uuid: str
     current_token: Optional[str] = None  # Optional - some agents may just provide UUID
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
-                "current_token": "a7f3c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a3f5c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
+            "current_token": "a7f3c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a3f5c9e2b1d4f6a8c0e1f2d3a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1"
         }
+    })
 
 
 class AgentTokenRotateResponse(BaseModel):
@@ -453,16 +465,15 @@ class AgentTokenRotateResponse(BaseModel):
     new_token: str  # New 128-character hex secret
     device_id: int
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "status": "success",
-                "message": "Token rotated successfully",
-                "old_token_revoked_at": "2024-01-15T10:30:45.123456+00:00",
-                "new_token": "b8f4d0e3c2e5f7a9d1f0e2d4c5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d2e3f4d0e3c2e5f7a9d1f0e2d4c5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d2",
-                "device_id": 42
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "status": "success",
+            "message": "Token rotated successfully",
+            "old_token_revoked_at": "2024-01-15T10:30:45.123456+00:00",
+            "new_token": "b8f4d0e3c2e5f7a9d1f0e2d4c5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d2e3f4d0e3c2e5f7a9d1f0e2d4c5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d2",
+            "device_id": 42
         }
+    })
 
 
 class AgentApprovalRequest(BaseModel):
@@ -470,13 +481,12 @@ class AgentApprovalRequest(BaseModel):
     action: str  # "approve" or "reject"
     reason: Optional[str] = None
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "action": "approve",
-                "reason": "Device verified on-site"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "action": "approve",
+            "reason": "Device verified on-site"
         }
+    })
 
 
 class AgentApprovalResponse(BaseModel):
@@ -488,14 +498,13 @@ class AgentApprovalResponse(BaseModel):
     approved_at: Optional[datetime] = None
     message: str
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "device_id": 42,
-                "is_approved": True,
-                "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
-                "hostname": "JOHN-PC",
-                "approved_at": "2024-01-15T10:30:45.123456+00:00",
-                "message": "Device approved"
-            }
-        }
\ No newline at end of file
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "device_id": 42,
+            "is_approved": True,
+            "device_uuid": "a3f5b2c1d4e7f9a8b3c5d7e9f1a3b5c7",
+            "hostname": "JOHN-PC",
+            "approved_at": "2024-01-15T10:30:45.123456+00:00",
+            "message": "Device approved"
+        }
+    })
\ No newline at end of file
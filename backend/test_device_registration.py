@@ -89,6 +89,11 @@ def test_device_registration():
         print("✅ Duplicate device handled correctly (returned existing)")
         dup_device = duplicate_response.json()
         print(f"   Same device ID: {dup_device['id']}")
+        # New and re-registered devices must serialize timestamps the same way
+        if dup_device['first_registered_at'] == device['first_registered_at']:
+            print("✅ Timestamps match between registration and re-registration")
+        else:
+            print(f"❌ Timestamp mismatch: {device['first_registered_at']} vs {dup_device['first_registered_at']}")
     else:
         print(f"❌ Duplicate handling failed: {duplicate_response.text}")
     
@@ -106,7 +111,7 @@ def test_device_registration():
         headers=headers
     )
     
-    if short_uuid_response.status_code == 400:
+    if short_uuid_response.status_code == 422:
         print("✅ Short UUID correctly rejected")
         print(f"   Error: {short_uuid_response.json()['detail']}")
     else:
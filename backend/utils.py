@@ -1,11 +1,15 @@
 """
 Utility functions for PHASE 1: Session Tracking & Geolocation
 """
+import asyncio
 import httpx
+import hashlib
+import hmac
 import json
 import ipaddress
+import time
 from user_agents import parse
-from fastapi import Request
+from fastapi import BackgroundTasks, Request
 from typing import Optional, Dict, Tuple
 from time_utils import now_ist, ensure_ist
 import logging
@@ -215,6 +219,55 @@ async def resolve_location_data(
     ip_data = await get_location_from_ip(ip_address)
     return ip_data, lat, lon
 
+# Successful IP lookups, keyed by network (IPv4 /24, IPv6 /64):
+# {"data": {...}, "expires_at": epoch}. Clients tend to repeat within short
+# windows, and addresses in one subnet share a location, so this saves an
+# ipapi.co round-trip on most logins/logouts.
+_GEO_IP_CACHE: Dict[str, dict] = {}
+_GEO_IP_CACHE_TTL_SECONDS = 3600
+_GEO_IP_CACHE_MAX_ENTRIES = 10_000
+
+# Lookups in progress, by cache key; concurrent requests from the same subnet
+# wait on one ipapi.co call instead of each making their own
+_GEO_IP_INFLIGHT: Dict[str, asyncio.Task] = {}
+
+
+def _geo_ip_cache_key(ip_obj) -> str:
+    prefix = 24 if ip_obj.version == 4 else 64
+    return str(ipaddress.ip_network(f"{ip_obj}/{prefix}", strict=False))
+
+
+def _cache_geo_ip(key: str, data: Dict[str, Optional[str]]) -> None:
+    if len(_GEO_IP_CACHE) >= _GEO_IP_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order; drop the oldest entry
+        _GEO_IP_CACHE.pop(next(iter(_GEO_IP_CACHE)), None)
+    _GEO_IP_CACHE[key] = {"data": data, "expires_at": time.time() + _GEO_IP_CACHE_TTL_SECONDS}
+
+
+async def _fetch_geo_ip(ip_address: str, key: str) -> Optional[Dict[str, Optional[str]]]:
+    """Query ipapi.co and cache the result under key; None if the lookup failed"""
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(f"https://ipapi.co/{ip_address}/json/")
+
+            if response.status_code == 200:
+                data = response.json()
+
+                if not data.get("error"):
+                    location = {
+                        "country": data.get("country_name", "Unknown"),
+                        "city": data.get("city", "Unknown"),
+                        "region": data.get("region", "Unknown"),
+                        "timezone": data.get("timezone", "UTC"),
+                        "isp": data.get("org", "Unknown")
+                    }
+                    _cache_geo_ip(key, location)
+                    return location
+    except Exception as e:
+        logger.error(f"Geolocation API error for IP {ip_address}: {e}")
+    return None
+
+
 async def get_location_from_ip(ip_address: str) -> Dict[str, Optional[str]]:
     """
     Fetch geolocation data from IP address using ipapi.co (HTTPS, free tier)
@@ -261,23 +314,21 @@ async def get_location_from_ip(ip_address: str) -> Dict[str, Optional[str]]:
             "isp": "Local Network"
         }
 
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"https://ipapi.co/{ip_address}/json/")
+    key = _geo_ip_cache_key(ip_obj)
+    cached = _GEO_IP_CACHE.get(key)
+    if cached and cached["expires_at"] > time.time():
+        return dict(cached["data"])
 
-            if response.status_code == 200:
-                data = response.json()
+    task = _GEO_IP_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_geo_ip(ip_address, key))
+        _GEO_IP_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _GEO_IP_INFLIGHT.pop(key, None))
 
-                if not data.get("error"):
-                    return {
-                        "country": data.get("country_name", "Unknown"),
-                        "city": data.get("city", "Unknown"),
-                        "region": data.get("region", "Unknown"),
-                        "timezone": data.get("timezone", "UTC"),
-                        "isp": data.get("org", "Unknown")
-                    }
-    except Exception as e:
-        logger.error(f"Geolocation API error for IP {ip_address}: {e}")
+    # Shielded so one caller going away doesn't cancel the lookup for the rest
+    location = await asyncio.shield(task)
+    if location:
+        return dict(location)
 
     # Fallback if API fails
     return {
@@ -358,6 +409,31 @@ def update_login_ip_history(user, ip_address: str) -> str:
     return json.dumps(history)
 
 
+def login_ip_history_append_expr(ip_address: str):
+    """
+    SQL expression that appends an IP to users.login_ip_history in the database,
+    keeping the last 10 entries. Same result as update_login_ip_history without
+    loading the user row; malformed or empty history restarts the list.
+    """
+    from sqlalchemy import case, func
+    from models import User
+
+    history = User.login_ip_history
+    trimmed = case(
+        (func.json_array_length(history) >= 10, func.json_remove(history, "$[0]")),
+        else_=history
+    )
+    appended = func.json_insert(trimmed, "$[#]", ip_address)
+    # Nested CASE so json_type() never sees invalid JSON
+    return case(
+        (func.json_valid(history) == 1, case(
+            (func.json_type(history) == "array", appended),
+            else_=func.json_array(ip_address)
+        )),
+        else_=func.json_array(ip_address)
+    )
+
+
 # =============================================================================
 # SESSION HELPERS
 # =============================================================================
@@ -431,9 +507,8 @@ def verify_agent_token(token: str, agent_token_hash: str) -> bool:
     Returns:
         True if tokens match, False otherwise
     """
-    import hashlib
     token_hash = hashlib.sha256(token.encode()).hexdigest()
-    return token_hash == agent_token_hash
+    return hmac.compare_digest(token_hash, agent_token_hash)
 
 
 def hash_agent_token(token: str) -> str:
@@ -449,7 +524,6 @@ def hash_agent_token(token: str) -> str:
     Returns:
         SHA256 hex digest
     """
-    import hashlib
     return hashlib.sha256(token.encode()).hexdigest()
 
 
@@ -595,15 +669,18 @@ def calculate_comprehensive_risk_score(
     risk_score = 0.0
     risk_factors = []
     
-    # Fetch user's historical data
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return 0.5, ["User not found"]
-    
-    # Get user's previous sessions
-    previous_sessions = db.query(SessionModel).filter(
-        SessionModel.user_id == user_id
+    # Fetch user existence and previous sessions in a single round-trip
+    # (outer join keeps the user row even when there is no session history)
+    history_rows = db.query(User.id, SessionModel).outerjoin(
+        SessionModel, SessionModel.user_id == User.id
+    ).filter(
+        User.id == user_id
     ).order_by(SessionModel.login_at.desc()).limit(20).all()
+
+    if not history_rows:
+        return 0.5, ["User not found"]
+
+    previous_sessions = [s for _, s in history_rows if s is not None]
     
     # Factor 1: New Country (HIGH RISK)
     previous_countries = set([s.country for s in previous_sessions if s.country])
@@ -862,22 +939,29 @@ async def create_login_session(
     user_id: int,
     request: Request,
     device_id: Optional[int],
+    background_tasks: BackgroundTasks,
     browser_location: Optional[dict] = None,
     risk_threshold: float = 0.5
 ):
     """
     Create comprehensive login session with risk assessment and email alerts.
+
+    The session row and login history update are only flushed; the caller
+    commits them together with its own login log. The email alert is queued
+    on background_tasks, so it goes out after the response (and that commit)
+    rather than while the write transaction is open.
     
     Args:
         db: Database session
         user_id: User ID
         request: FastAPI request object
         device_id: Device ID (optional)
+        background_tasks: Request background tasks the email alert is queued on
         browser_location: GPS coordinates from browser (optional)
         risk_threshold: Send email if risk_score >= threshold
         
     Returns:
-        Session object
+        Session object (flushed, not committed)
     """
     from models import Session as SessionModel, User
     from datetime import datetime
@@ -930,40 +1014,39 @@ async def create_login_session(
     )
     
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    # Flush for the INSERT (and session_id/login_at defaults); the caller's
+    # commit persists it together with the login history update below
+    db.flush()
+    login_at = session.login_at
+    
+    # Update user's login history in one UPDATE; the IP list is appended
+    # database-side so the user row doesn't need to be read back first
+    db.query(User).filter(User.id == user_id).update({
+        User.last_login_country: country,
+        User.login_ip_history: login_ip_history_append_expr(ip_address),
+        User.last_login_at: now_ist()
+    }, synchronize_session=False)
     
-    # Send email alert if risk exceeds threshold
+    # Queue email alert if risk exceeds threshold (don't block login)
     if risk_score >= risk_threshold:
         user = db.query(User).filter(User.id == user_id).first()
         if user:
             user_email = user.company_email or user.personal_email
             if user_email:
-                # Send email asynchronously (don't block login)
-                try:
-                    await send_suspicious_login_email(
-                        user_email=user_email,
-                        user_name=user.name,
-                        ip_address=ip_address,
-                        country=country,
-                        city=city,
-                        latitude=latitude,
-                        longitude=longitude,
-                        browser=user_agent_info.get("browser", "Unknown"),
-                        os=user_agent_info.get("os", "Unknown"),
-                        timestamp=session.login_at,
-                        risk_score=risk_score,
-                        risk_factors=risk_factors
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send suspicious login email: {e}")
-    
-    # Update user's login history
-    user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        user.last_login_country = country
-        user.login_ip_history = update_login_ip_history(user, ip_address)
-        user.last_login_at = now_ist()
-        db.commit()
+                background_tasks.add_task(
+                    send_suspicious_login_email,
+                    user_email=user_email,
+                    user_name=user.name,
+                    ip_address=ip_address,
+                    country=country,
+                    city=city,
+                    latitude=latitude,
+                    longitude=longitude,
+                    browser=user_agent_info.get("browser", "Unknown"),
+                    os=user_agent_info.get("os", "Unknown"),
+                    timestamp=login_at,
+                    risk_score=risk_score,
+                    risk_factors=risk_factors
+                )
     
     return session
\ No newline at end of file